@@ -0,0 +1,378 @@
+# channel_index.py
+# Channel rollups keyed by channel_id, updated incrementally on each collection
+#
+# Tables (in the query store, data/trends.db):
+#   channel_daily   - per date/region/category/channel appearances and stats;
+#                     region '*' holds the sum over all regions
+#   channel_videos  - distinct videos per channel with their highest view count
+#   channels        - per channel totals: appearances, regions reached,
+#                     total/median views, engagement, first/last seen
+#   channel_window  - per window/region/category/channel sums; 'all' is kept
+#                     up to date by adding each new day, shorter windows are
+#                     recomputed from channel_daily over the window only
+#   channel_top     - ranked top channels per window/region/category, so a
+#                     top-channels query is a single primary-key range read
+#
+# The index is updated whenever trend_store.ingest_snapshot stores a snapshot;
+# queries only read it. Run `python channel_index.py --rebuild` to rebuild it
+# from every snapshot in the store.
+
+import argparse
+import sqlite3
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from storage import partition_lock
+from trend_store import open_store, snapshot_dates, load_snapshot
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS channel_daily (
+    date TEXT NOT NULL,
+    region TEXT NOT NULL,
+    category TEXT NOT NULL,
+    channel_id TEXT NOT NULL,
+    appearances INTEGER NOT NULL,
+    views INTEGER NOT NULL,
+    likes INTEGER NOT NULL,
+    comments INTEGER NOT NULL,
+    PRIMARY KEY (date, region, category, channel_id)
+);
+CREATE INDEX IF NOT EXISTS idx_channel_daily_channel ON channel_daily (channel_id);
+
+CREATE TABLE IF NOT EXISTS channel_videos (
+    channel_id TEXT NOT NULL,
+    video_id TEXT NOT NULL,
+    max_views INTEGER NOT NULL,
+    PRIMARY KEY (channel_id, video_id)
+);
+
+CREATE TABLE IF NOT EXISTS channels (
+    channel_id TEXT PRIMARY KEY,
+    channel_title TEXT,
+    appearances INTEGER NOT NULL,
+    regions INTEGER NOT NULL,
+    videos INTEGER NOT NULL,
+    total_views INTEGER NOT NULL,
+    median_views INTEGER NOT NULL,
+    engagement_rate REAL NOT NULL,
+    first_seen TEXT NOT NULL,
+    last_seen TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS channel_window (
+    window TEXT NOT NULL,
+    region TEXT NOT NULL,
+    category TEXT NOT NULL,
+    channel_id TEXT NOT NULL,
+    appearances INTEGER NOT NULL,
+    views INTEGER NOT NULL,
+    likes INTEGER NOT NULL,
+    comments INTEGER NOT NULL,
+    PRIMARY KEY (window, region, category, channel_id)
+);
+
+CREATE TABLE IF NOT EXISTS channel_top (
+    window TEXT NOT NULL,
+    region TEXT NOT NULL,
+    category TEXT NOT NULL,
+    rank INTEGER NOT NULL,
+    channel_id TEXT NOT NULL,
+    appearances INTEGER NOT NULL,
+    views INTEGER NOT NULL,
+    engagement_rate REAL NOT NULL,
+    PRIMARY KEY (window, region, category, rank)
+);
+"""
+
+# Precomputed windows in days; 'all' covers the whole history
+WINDOWS = ['1', '7', '30', '90', 'all']
+
+# Channels kept per window/region/category ranking
+TOP_N = 50
+
+# Region key for rollups across all regions
+ALL_REGIONS = '*'
+
+def ensure_schema(conn):
+    """Create the channel index tables if needed"""
+    conn.executescript(SCHEMA)
+
+def _daily_rows(all_trends, date):
+    """Aggregate a snapshot into channel_daily rows (including the all-regions rollup)"""
+    totals = defaultdict(lambda: [0, 0, 0, 0])
+
+    for region, region_data in all_trends.items():
+        for category, videos in region_data.items():
+            for video in videos:
+                for key_region in (region, ALL_REGIONS):
+                    row = totals[(key_region, category, video['channel_id'])]
+                    row[0] += 1
+                    row[1] += int(video.get('view_count') or 0)
+                    row[2] += int(video.get('like_count') or 0)
+                    row[3] += int(video.get('comment_count') or 0)
+
+    return [(date, region, category, channel_id, *values) for (region, category, channel_id), values in totals.items()]
+
+def window_start(end_date, window):
+    """First date of a window of days ending at end_date (None for 'all', i.e. no lower bound)"""
+    if str(window) == 'all':
+        return None
+    return (datetime.strptime(end_date, '%Y-%m-%d') - timedelta(days=int(window) - 1)).strftime('%Y-%m-%d')
+
+def _date_range(column, start_date, end_date):
+    """SQL condition and parameters for dates from start_date (None = open-ended) to end_date"""
+    if start_date is None:
+        return f'{column} <= ?', [end_date]
+    return f'{column} BETWEEN ? AND ?', [start_date, end_date]
+
+def _add_to_all_window(conn, date, sign):
+    """Add (sign=1) or remove (sign=-1) one day's rows from the 'all' window"""
+    conn.execute("""
+        INSERT INTO channel_window (window, region, category, channel_id, appearances, views, likes, comments)
+        SELECT 'all', region, category, channel_id, ? * appearances, ? * views, ? * likes, ? * comments
+        FROM channel_daily WHERE date = ?
+        ON CONFLICT (window, region, category, channel_id) DO UPDATE SET
+            appearances = appearances + excluded.appearances,
+            views = views + excluded.views,
+            likes = likes + excluded.likes,
+            comments = comments + excluded.comments
+    """, (sign, sign, sign, sign, date))
+    conn.execute("DELETE FROM channel_window WHERE window = 'all' AND appearances <= 0")
+
+def _refresh_channels(conn, channel_ids, titles):
+    """Recompute the per-channel totals of the given channels"""
+    for channel_id in channel_ids:
+        totals = conn.execute("""
+            SELECT SUM(appearances), SUM(views), SUM(likes), SUM(comments), MIN(date), MAX(date)
+            FROM channel_daily WHERE channel_id = ? AND region = ? AND category = 'All'
+        """, (channel_id, ALL_REGIONS)).fetchone()
+
+        if totals[0] is None:
+            # The channel only trended outside the 'All' chart; fall back to every category
+            totals = conn.execute("""
+                SELECT SUM(appearances), SUM(views), SUM(likes), SUM(comments), MIN(date), MAX(date)
+                FROM channel_daily WHERE channel_id = ? AND region = ?
+            """, (channel_id, ALL_REGIONS)).fetchone()
+
+        if totals[0] is None:
+            # A re-collected date removed the channel's only appearances
+            conn.execute('DELETE FROM channels WHERE channel_id = ?', (channel_id,))
+            conn.execute('DELETE FROM channel_videos WHERE channel_id = ?', (channel_id,))
+            continue
+
+        regions = conn.execute("""
+            SELECT COUNT(DISTINCT region) FROM channel_daily WHERE channel_id = ? AND region != ?
+        """, (channel_id, ALL_REGIONS)).fetchone()[0]
+        views = [row[0] for row in conn.execute(
+            'SELECT max_views FROM channel_videos WHERE channel_id = ? ORDER BY max_views', (channel_id,)
+        )]
+
+        appearances, window_views, likes, comments, first_seen, last_seen = totals
+        middle = len(views) // 2
+        median = (views[middle] if len(views) % 2 else (views[middle - 1] + views[middle]) // 2) if views else 0
+
+        # Channels missing from the snapshot keep their last known title
+        conn.execute("""
+            INSERT INTO channels VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (channel_id) DO UPDATE SET
+                channel_title = COALESCE(excluded.channel_title, channel_title),
+                appearances = excluded.appearances,
+                regions = excluded.regions,
+                videos = excluded.videos,
+                total_views = excluded.total_views,
+                median_views = excluded.median_views,
+                engagement_rate = excluded.engagement_rate,
+                first_seen = excluded.first_seen,
+                last_seen = excluded.last_seen
+        """, (
+            channel_id, titles.get(channel_id), appearances, regions, len(views), sum(views), median,
+            (likes + comments) / window_views if window_views else 0.0, first_seen, last_seen
+        ))
+
+def _refresh_windows(conn, latest):
+    """Recompute the fixed-length windows ending at the latest date and all rankings"""
+    for window in WINDOWS:
+        if window != 'all':
+            start = window_start(latest, window)
+            conn.execute('DELETE FROM channel_window WHERE window = ?', (window,))
+            conn.execute("""
+                INSERT INTO channel_window
+                SELECT ?, region, category, channel_id, SUM(appearances), SUM(views), SUM(likes), SUM(comments)
+                FROM channel_daily WHERE date BETWEEN ? AND ?
+                GROUP BY region, category, channel_id
+            """, (window, start, latest))
+
+        conn.execute('DELETE FROM channel_top WHERE window = ?', (window,))
+        conn.execute("""
+            INSERT INTO channel_top
+            SELECT window, region, category, rank, channel_id, appearances, views, engagement_rate FROM (
+                SELECT window, region, category, channel_id, appearances, views,
+                       CASE WHEN views > 0 THEN (likes + comments) * 1.0 / views ELSE 0 END AS engagement_rate,
+                       ROW_NUMBER() OVER (
+                           PARTITION BY region, category ORDER BY appearances DESC, views DESC
+                       ) AS rank
+                FROM channel_window WHERE window = ?
+            ) WHERE rank <= ?
+        """, (window, TOP_N))
+
+def update_channel_index(conn, all_trends, date):
+    """Fold one collection snapshot into the channel index"""
+    ensure_schema(conn)
+
+    titles = {}
+    max_views = {}
+    for region_data in all_trends.values():
+        for videos in region_data.values():
+            for video in videos:
+                titles[video['channel_id']] = video.get('channel_title')
+                key = (video['channel_id'], video['video_id'])
+                max_views[key] = max(max_views.get(key, 0), int(video.get('view_count') or 0))
+
+    with conn:
+        # Re-collecting a date replaces its previous contribution
+        replaced = {row[0] for row in conn.execute('SELECT DISTINCT channel_id FROM channel_daily WHERE date = ?', (date,))}
+        _add_to_all_window(conn, date, -1)
+        conn.execute('DELETE FROM channel_daily WHERE date = ?', (date,))
+
+        conn.executemany('INSERT INTO channel_daily VALUES (?, ?, ?, ?, ?, ?, ?, ?)', _daily_rows(all_trends, date))
+        _add_to_all_window(conn, date, 1)
+
+        if replaced:
+            # Peak views may have come from the replaced snapshot; recount from the store
+            conn.executemany('DELETE FROM channel_videos WHERE channel_id = ?', [(c,) for c in replaced])
+            conn.executemany("""
+                INSERT INTO channel_videos
+                SELECT channel_id, video_id, MAX(view_count) FROM videos
+                WHERE channel_id = ? AND date != ? GROUP BY video_id
+            """, [(c, date) for c in replaced])
+
+        conn.executemany("""
+            INSERT INTO channel_videos VALUES (?, ?, ?)
+            ON CONFLICT (channel_id, video_id) DO UPDATE SET max_views = MAX(max_views, excluded.max_views)
+        """, [(channel_id, video_id, views) for (channel_id, video_id), views in max_views.items()])
+
+        _refresh_channels(conn, replaced | set(titles), titles)
+
+        latest = conn.execute('SELECT MAX(date) FROM channel_daily').fetchone()[0]
+        _refresh_windows(conn, latest)
+
+def rebuild_channel_index(conn):
+    """Rebuild the channel index from every snapshot in the query store"""
+    ensure_schema(conn)
+    with conn:
+        for table in ('channel_daily', 'channel_videos', 'channels', 'channel_window', 'channel_top'):
+            conn.execute(f'DELETE FROM {table}')
+
+    for date in sorted(snapshot_dates(conn)):
+        update_channel_index(conn, load_snapshot(conn, date), date)
+
+def index_snapshot(conn, all_trends, date):
+    """Update the channel index with a snapshot just ingested into the store"""
+    with partition_lock('channels'):
+        ensure_schema(conn)
+        if conn.execute('SELECT 1 FROM channel_daily LIMIT 1').fetchone() is None and \
+                conn.execute('SELECT 1 FROM videos WHERE date != ? LIMIT 1', (date,)).fetchone() is not None:
+            # First update of a store that already had snapshots: index them all
+            rebuild_channel_index(conn)
+        else:
+            update_channel_index(conn, all_trends, date)
+
+def latest_indexed_date(conn):
+    """Date the precomputed windows end at (None if nothing is indexed yet)"""
+    try:
+        return conn.execute('SELECT MAX(date) FROM channel_daily').fetchone()[0]
+    except sqlite3.OperationalError:
+        # Store created before the channel index; the next ingest builds it
+        return None
+
+def _channel_rows(conn, ranked, params, region, category, start_date, end_date):
+    """Complete ranked (rank, channel_id, appearances, views, engagement_rate) rows
+
+    Adds the regions the channel trended in over the same window; its
+    videos, views and median views over its whole history are labelled
+    all_time_*.
+    """
+    dates, date_params = _date_range('d.date', start_date, end_date)
+    regions = 'd.region != ?' if region == ALL_REGIONS else 'd.region = ?'
+
+    query = f"""
+        SELECT w.rank, w.channel_id, c.channel_title, w.appearances, w.views, w.engagement_rate,
+               (SELECT COUNT(DISTINCT d.region) FROM channel_daily d
+                WHERE d.channel_id = w.channel_id AND {regions} AND d.category = ? AND {dates}) AS regions,
+               c.videos AS all_time_videos, c.total_views AS all_time_views,
+               c.median_views AS all_time_median_views, c.first_seen, c.last_seen
+        FROM ({ranked}) w JOIN channels c ON c.channel_id = w.channel_id
+        ORDER BY w.rank
+    """
+    return [dict(row) for row in conn.execute(query, [region, category, *date_params, *params])]
+
+def top_channels(conn, window='30', region=ALL_REGIONS, category='All', limit=10):
+    """Top channels for a precomputed window/region/category, ending at the latest indexed date
+
+    window is one of WINDOWS; region None or '*' means all regions.
+    """
+    region = region or ALL_REGIONS
+    latest = latest_indexed_date(conn)
+    if latest is None:
+        return []
+
+    ranked = """
+        SELECT rank, channel_id, appearances, views, engagement_rate FROM channel_top
+        WHERE window = ? AND region = ? AND category = ? AND rank <= ?
+    """
+    return _channel_rows(conn, ranked, [str(window), region, category, limit],
+                         region, category, window_start(latest, window), latest)
+
+def top_channels_between(conn, start_date, end_date, region=ALL_REGIONS, category='All', limit=10):
+    """Top channels over any range of dates, summed from the daily rollups
+
+    start_date None means from the first collection. Returns the same
+    columns as top_channels.
+    """
+    region = region or ALL_REGIONS
+    dates, date_params = _date_range('date', start_date, end_date)
+
+    ranked = f"""
+        SELECT ROW_NUMBER() OVER (ORDER BY SUM(appearances) DESC, SUM(views) DESC) AS rank, channel_id,
+               SUM(appearances) AS appearances, SUM(views) AS views,
+               CASE WHEN SUM(views) > 0 THEN (SUM(likes) + SUM(comments)) * 1.0 / SUM(views) ELSE 0 END AS engagement_rate
+        FROM channel_daily WHERE region = ? AND category = ? AND {dates}
+        GROUP BY channel_id ORDER BY rank LIMIT ?
+    """
+    return _channel_rows(conn, ranked, [region, category, *date_params, limit],
+                         region, category, start_date, end_date)
+
+def channel_profile(conn, channel_id):
+    """Rollup of a single channel (None if it never trended)"""
+    if latest_indexed_date(conn) is None:
+        return None
+    row = conn.execute('SELECT * FROM channels WHERE channel_id = ?', (channel_id,)).fetchone()
+    return dict(row) if row else None
+
+def channel_titles(conn, channel_ids):
+    """Last known title of each given channel as {channel_id: title}"""
+    ensure_schema(conn)
+    channel_ids = list(channel_ids)
+    titles = {}
+
+    for i in range(0, len(channel_ids), 500):
+        chunk = channel_ids[i:i + 500]
+        query = f"""
+            SELECT channel_id, channel_title FROM channels
+            WHERE channel_id IN ({','.join('?' * len(chunk))})
+        """
+        titles.update((row[0], row[1]) for row in conn.execute(query, chunk))
+
+    return titles
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Maintain the channel index')
+    parser.add_argument('--rebuild', action='store_true', help='Rebuild the index from every snapshot in the query store')
+    args = parser.parse_args()
+
+    if args.rebuild:
+        with partition_lock('channels'), open_store() as conn:
+            rebuild_channel_index(conn)
+            print(f"Channel index rebuilt up to {latest_indexed_date(conn)}")
+    else:
+        parser.print_help()
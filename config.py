@@ -21,4 +21,10 @@ CATEGORIES = {
 REGIONS = ['US', 'IN', 'GB', 'CA', 'AU', 'JP', 'KR', 'FR', 'DE', 'BR']  
 
 # Maximum results per API call
-MAX_RESULTS = 50  # Maximum allowed is 50
\ No newline at end of file
+MAX_RESULTS = 50  # Maximum allowed is 50
+
+# Data retention (days): raw files are kept this long, then packed per day
+RETENTION_RAW_DAYS = 7
+
+# After this many days, daily archives are merged into weekly archives
+RETENTION_DAILY_DAYS = 30
@@ -1,15 +1,17 @@
 # dashboard.py - simplified version with native Streamlit components
 import streamlit as st
 import pandas as pd
-import json
 import os
-import glob
 import plotly.express as px
 from datetime import datetime
 import time
 from data_collector import collect_all_trending_data
-from trend_analyzer import analyze_all_trending_data
-from llm_insights import generate_insights
+from trend_analyzer import analyze_all_trending_data, build_category_view, load_region_matrices, query_top_channels
+from llm_insights import stream_insights
+import trend_store
+from retention import read_archived_file
+from similarity_index import SimilarityIndex, search_videos, similar_videos, MANIFEST_PATH
+from shared_results import open_shared_analysis
 from config import REGIONS, CATEGORIES
 
 # Set page configuration
@@ -37,12 +39,107 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+# Cache bounds: entries are keyed by date and version, so superseded versions
+# are evicted (least recently used first) instead of living as long as the server
+CACHE_DATES = 8         # analyses and comparison matrices
+CACHE_FIGURES = 64      # figure sets, one per date/region/category selection
+CACHE_TTL = 3600        # seconds before an entry is dropped and rebuilt on next use
+
 def load_available_dates():
     """Load available analysis dates"""
-    analysis_files = glob.glob('data/analysis_*.json')
-    dates = [f.split('analysis_')[1].split('.json')[0] for f in analysis_files]
-    dates.sort(reverse=True)
-    return dates
+    with trend_store.open_store() as conn:
+        return trend_store.analysis_dates(conn)
+
+def analysis_version(date):
+    """Last write time of a date's analysis, used to invalidate cached views"""
+    with trend_store.open_store() as conn:
+        return trend_store.analysis_version(conn, date)
+
+@st.cache_data(max_entries=64)
+def load_archived_file(date, name, location=None):
+    """Read a file retention moved into an archive (cached per archive location)"""
+    with trend_store.open_store() as conn:
+        return read_archived_file(conn, date, name)
+
+@st.cache_resource(max_entries=CACHE_DATES, ttl=CACHE_TTL)
+def load_shared_analysis(date, version=None):
+    """Map a date's shared analysis file, shared by every session of the server"""
+    return open_shared_analysis(date)
+
+@st.cache_data(max_entries=CACHE_DATES, ttl=CACHE_TTL)
+def load_parsed_analysis(date, version=None):
+    """Load the analysis results for a date from the store (cached across reruns)"""
+    with trend_store.open_store() as conn:
+        return trend_store.load_analysis(conn, date)
+
+def load_analysis(date, version=None):
+    """Load the analysis results for a date, preferring the shared memory-mapped copy"""
+    try:
+        shared = load_shared_analysis(date, version)
+    except (OSError, ValueError) as e:
+        print(f"Error mapping shared analysis for {date}: {e}")
+        shared = None
+    return shared if shared is not None else load_parsed_analysis(date, version)
+
+def _horizontal_bar(view, label, value_label, color_scale, height):
+    """Horizontal bar chart from a pre-sorted view model entry"""
+    fig = px.bar(
+        x=view['counts'],
+        y=view['labels'],
+        orientation='h',
+        color=view['counts'],
+        color_continuous_scale=color_scale,
+        text=view['counts'],
+        labels={'x': 'Count', 'y': label, 'color': 'Count'}
+    )
+    
+    fig.update_layout(
+        height=height,
+        xaxis_title=value_label,
+        yaxis_title="",
+        coloraxis_showscale=False
+    )
+    
+    return fig
+
+@st.cache_resource(max_entries=CACHE_FIGURES, ttl=CACHE_TTL)
+def build_category_figures(date, region, category, version=None):
+    """Build the Plotly figures for one region/category, memoized per selection"""
+    category_data = load_analysis(date, version)[region][category]
+    view = category_data.get('view') or build_category_view(category_data)
+    
+    figures = {}
+    
+    figures['formats'] = _horizontal_bar(view['formats'], 'Format', "Number of Videos", 'Reds', 400)
+    
+    figures['duration'] = px.bar(
+        x=view['duration']['labels'],
+        y=view['duration']['counts'],
+        color=view['duration']['counts'],
+        color_continuous_scale='Blues',
+        text=view['duration']['counts'],
+        labels={'x': 'Duration', 'y': 'Count', 'color': 'Count'}
+    )
+    figures['duration'].update_layout(
+        height=400,
+        xaxis_title="",
+        yaxis_title="Number of Videos",
+        coloraxis_showscale=False
+    )
+    
+    figures['words'] = px.treemap(
+        names=view['words']['labels'],
+        parents=[''] * len(view['words']['labels']),
+        values=view['words']['counts'],
+        color=view['words']['counts'],
+        color_continuous_scale='Reds'
+    )
+    
+    figures['tags'] = _horizontal_bar(view['tags'], 'Tag', "Frequency", 'Greens', 500)
+    
+    figures['channels'] = _horizontal_bar(view['channels'], 'Channel', "Number of Trending Videos", 'Viridis', 500)
+    
+    return figures
 
 def run_dashboard():
     """Run the Streamlit dashboard"""
@@ -57,13 +154,17 @@ def run_dashboard():
         
         selected_tab = st.radio(
             "Go to",
-            ["Dashboard", "Collect New Data", "About"],
+            ["Dashboard", "Compare Regions", "Similar Videos", "Collect New Data", "About"],
             key="navigation"
         )
     
     # Main content based on selected tab
     if selected_tab == "Dashboard":
         display_dashboard()
+    elif selected_tab == "Compare Regions":
+        compare_regions_page()
+    elif selected_tab == "Similar Videos":
+        similar_videos_page()
     elif selected_tab == "Collect New Data":
         collect_data_page()
     else:
@@ -116,8 +217,8 @@ def display_dashboard():
     
     try:
         # Load analysis data
-        with open(f'data/analysis_{selected_date}.json', 'r') as f:
-            analysis_data = json.load(f)
+        version = analysis_version(selected_date)
+        analysis_data = load_analysis(selected_date, version)
         
         # Region and category selection
         col1, col2 = st.columns(2)
@@ -162,160 +263,95 @@ def display_dashboard():
                 value=f"{category_data['stats']['avg_duration'] // 60} min"
             )
         
+        # Charts are built once per (date, region, category) and memoized
+        figures = build_category_figures(selected_date, selected_region, selected_category, version)
+        
         # Video formats visualization with Plotly
         st.header("Video Formats")
-        
-        formats_df = pd.DataFrame({
-            'Format': list(category_data['video_formats'].keys()),
-            'Count': list(category_data['video_formats'].values())
-        }).sort_values('Count', ascending=False)
-        
-        # Create interactive bar chart
-        fig = px.bar(
-            formats_df, 
-            x='Count', 
-            y='Format',
-            orientation='h',
-            color='Count',
-            color_continuous_scale='Reds',
-            text='Count'
-        )
-        
-        fig.update_layout(
-            height=400,
-            xaxis_title="Number of Videos",
-            yaxis_title="",
-            coloraxis_showscale=False
-        )
-        
-        st.plotly_chart(fig, use_container_width=True)
+        st.plotly_chart(figures['formats'], use_container_width=True)
         
         # Duration distribution visualization
         st.header("Video Duration Distribution")
-        
-        duration_df = pd.DataFrame({
-            'Duration': list(category_data['duration_distribution'].keys()),
-            'Count': list(category_data['duration_distribution'].values())
-        })
-        
-        # Create interactive duration chart
-        fig = px.bar(
-            duration_df,
-            x='Duration',
-            y='Count',
-            color='Count',
-            color_continuous_scale='Blues',
-            text='Count'
-        )
-        
-        fig.update_layout(
-            height=400,
-            xaxis_title="",
-            yaxis_title="Number of Videos",
-            coloraxis_showscale=False
-        )
-        
-        st.plotly_chart(fig, use_container_width=True)
+        st.plotly_chart(figures['duration'], use_container_width=True)
         
         # Common words and tags in two columns with interactive charts
         col1, col2 = st.columns(2)
         
         with col1:
             st.header("Common Words in Titles")
-            
-            words_df = pd.DataFrame({
-                'Word': list(category_data['common_words'].keys()),
-                'Count': list(category_data['common_words'].values())
-            }).head(15).sort_values('Count', ascending=False)
-            
-            # Create treemap for words
-            fig = px.treemap(
-                words_df,
-                path=['Word'],
-                values='Count',
-                color='Count',
-                color_continuous_scale='Reds',
-                hover_data=['Count']
-            )
-            
-            st.plotly_chart(fig, use_container_width=True)
+            st.plotly_chart(figures['words'], use_container_width=True)
         
         with col2:
             st.header("Top Tags")
-            
-            tags_df = pd.DataFrame({
-                'Tag': list(category_data['top_tags'].keys()),
-                'Count': list(category_data['top_tags'].values())
-            }).head(15).sort_values('Count', ascending=False)
-            
-            # Create horizontal bar chart for tags
-            fig = px.bar(
-                tags_df,
-                x='Count',
-                y='Tag',
-                orientation='h',
-                color='Count',
-                color_continuous_scale='Greens',
-                text='Count'
-            )
-            
-            fig.update_layout(
-                height=500,
-                xaxis_title="Frequency",
-                yaxis_title="",
-                coloraxis_showscale=False
-            )
-            
-            st.plotly_chart(fig, use_container_width=True)
+            st.plotly_chart(figures['tags'], use_container_width=True)
         
-        # Channel analysis with bubble chart
+        # Channel analysis
         st.header("Top Channels")
+        st.plotly_chart(figures['channels'], use_container_width=True)
         
-        # Create channel dataframe
-        channel_df = pd.DataFrame({
-            'Channel': list(category_data['top_channels'].keys()),
-            'Videos': list(category_data['top_channels'].values())
-        }).head(10).sort_values('Videos', ascending=False)
-        
-        # Create bar chart for channels
-        fig = px.bar(
-            channel_df,
-            x='Videos',
-            y='Channel',
-            orientation='h',
-            color='Videos',
-            color_continuous_scale='Viridis',
-            text='Videos'
-        )
-        
-        fig.update_layout(
-            height=500,
-            xaxis_title="Number of Trending Videos",
-            yaxis_title="",
-            coloraxis_showscale=False
+        # Channels over a longer window, answered by the channel index rollups
+        window = st.select_slider(
+            "Top channels over the last", options=[1, 7, 30, 90, 'all'], value=30,
+            format_func=lambda d: "all collected days" if d == 'all' else f"{d} days"
         )
-        
-        st.plotly_chart(fig, use_container_width=True)
+        leaderboard = query_top_channels(category=selected_category, region=selected_region, days=window, end_date=selected_date)
+        
+        if leaderboard:
+            st.dataframe(
+                pd.DataFrame(leaderboard).rename(columns={
+                    'channel_title': 'Channel',
+                    'appearances': 'Trending Appearances',
+                    'views': 'Views',
+                    'engagement_rate': 'Engagement Rate',
+                    'regions': 'Regions',
+                    'all_time_videos': 'Videos (All Time)',
+                    'all_time_views': 'Total Views (All Time)',
+                    'all_time_median_views': 'Median Views (All Time)',
+                    'first_seen': 'First Seen',
+                    'last_seen': 'Last Seen'
+                }).drop(columns=['channel_id', 'rank'], errors='ignore'),
+                use_container_width=True
+            )
         
         # AI Insights
         st.header("AI-Powered Insights")
         
         insights_file = f'data/insights/{selected_date}_{selected_region}_{selected_category.replace(" & ", "_")}.txt'
         
+        insights = None
         if os.path.exists(insights_file):
             with open(insights_file, 'r') as f:
                 insights = f.read()
-            
+        else:
+            # Older insights may have been moved into an archive by retention
+            with trend_store.open_store() as conn:
+                entry = trend_store.catalog_entry(conn, selected_date)
+            archived = None
+            if entry and entry['location']:
+                archived = load_archived_file(selected_date, os.path.relpath(insights_file, 'data'), entry['location'])
+            if archived is not None:
+                insights = archived.decode('utf-8')
+        
+        if insights is not None:
             # Display insights in an expander
             with st.expander("View AI Insights", expanded=True):
                 st.markdown(insights)
         else:
             # Button for generating insights
             if st.button("Generate AI Insights", key="generate_insights"):
-                with st.spinner("Analyzing YouTube trends with AI..."):
-                    # Generate insights
-                    insights = generate_insights(analysis_data, selected_region, selected_category)
-                    st.markdown(insights)
+                placeholder = st.empty()
+                placeholder.info("Analyzing YouTube trends with AI...")
+                
+                # Render tokens as they arrive
+                metrics = {}
+                insights = ""
+                for chunk in stream_insights(analysis_data, selected_region, selected_category, date=selected_date, metrics=metrics):
+                    insights += chunk
+                    placeholder.markdown(insights)
+                
+                if metrics.get('time_to_first_token') is not None:
+                    st.caption(f"First token after {metrics['time_to_first_token']:.2f}s, "
+                               f"completed in {metrics['total_time']:.2f}s")
     
     except Exception as e:
         st.error(f"Error loading analysis data: {e}")
@@ -327,6 +363,147 @@ def display_dashboard():
         - Try collecting data again
         """)
 
+def comparison_version(date, entry=None):
+    """Last write time of a date's comparison matrices (None if there are none)"""
+    path = f'data/comparison_{date}.npz'
+    if os.path.exists(path):
+        return os.path.getmtime(path)
+    # Weekly compaction moves the file into the week's archive
+    if entry and entry['tier'] == 'weekly' and entry['location'] and os.path.exists(entry['location']):
+        return os.path.getmtime(entry['location'])
+    return None
+
+@st.cache_resource(max_entries=CACHE_DATES, ttl=CACHE_TTL)
+def load_comparison(date, version=None):
+    """Load the precomputed region x feature matrices for a date"""
+    return load_region_matrices(date)
+
+def _heatmap(matrix, x_labels, regions, color_scale):
+    """Heatmap of a region x feature matrix"""
+    fig = px.imshow(
+        matrix,
+        x=list(x_labels),
+        y=list(regions),
+        color_continuous_scale=color_scale,
+        aspect='auto',
+        text_auto=True
+    )
+    
+    fig.update_layout(height=max(300, 40 * len(regions)), xaxis_title="", yaxis_title="")
+    
+    return fig
+
+@st.cache_resource(max_entries=CACHE_FIGURES, ttl=CACHE_TTL)
+def build_comparison_figures(date, category, version=None):
+    """Build the comparison heatmaps for one category, memoized per selection"""
+    matrices = load_comparison(date, version)[category]
+    regions = matrices['regions']
+    
+    return {
+        'formats': _heatmap(matrices['formats'], matrices['format_labels'], regions, 'Reds'),
+        'duration': _heatmap(matrices['duration'], matrices['duration_labels'], regions, 'Blues'),
+        'tags': _heatmap(matrices['tags'], matrices['tag_labels'], regions, 'Greens'),
+        'similarity': _heatmap(matrices['similarity'].round(2), regions, regions, 'Viridis'),
+    }
+
+def compare_regions_page():
+    """Compare trends across regions for one category"""
+    
+    st.header("Compare Regions")
+    
+    with trend_store.open_store() as conn:
+        catalog = {e['date']: e for e in trend_store.catalog_entries(conn)}
+    versions = {d: comparison_version(d, catalog.get(d)) for d in load_available_dates()}
+    dates = [d for d, version in versions.items() if version is not None]
+    
+    if not dates:
+        st.warning("No comparison data available. Please collect and analyze data first.")
+        return
+    
+    selected_date = st.selectbox("Select Date", dates, key="compare_date_selector")
+    
+    try:
+        version = versions[selected_date]
+        comparison = load_comparison(selected_date, version)
+        
+        selected_category = st.selectbox("Select Category", list(comparison.keys()), key="compare_category")
+        matrices = comparison[selected_category]
+        figures = build_comparison_figures(selected_date, selected_category, version)
+        
+        st.subheader("Video Formats by Region")
+        st.plotly_chart(figures['formats'], use_container_width=True)
+        
+        st.subheader("Video Duration by Region")
+        st.plotly_chart(figures['duration'], use_container_width=True)
+        
+        st.subheader("Top Tags by Region")
+        st.plotly_chart(figures['tags'], use_container_width=True)
+        
+        # Similarity between regions
+        st.subheader("Region Similarity")
+        st.plotly_chart(figures['similarity'], use_container_width=True)
+        
+        regions = matrices['regions'].tolist()
+        selected_region = st.selectbox("Find regions most similar to", regions, key="compare_region")
+        
+        row = matrices['similarity'][regions.index(selected_region)]
+        ranking = [(regions[i], row[i]) for i in row.argsort()[::-1] if regions[i] != selected_region]
+        
+        st.dataframe(
+            pd.DataFrame(ranking, columns=['Region', 'Similarity']),
+            use_container_width=True
+        )
+    
+    except Exception as e:
+        st.error(f"Error loading comparison data: {e}")
+
+@st.cache_resource(max_entries=2)
+def load_similarity_index(version=None):
+    """Open the memory-mapped similarity index (reopened when it changes)"""
+    return SimilarityIndex()
+
+def similar_videos_page():
+    """Search trending videos across regions and dates by title and tags"""
+    
+    st.header("Similar Videos")
+    
+    if not os.path.exists(MANIFEST_PATH):
+        st.warning("The similarity index is empty. Please collect data first.")
+        return
+    
+    index = load_similarity_index(os.path.getmtime(MANIFEST_PATH))
+    st.caption(f"{index.documents:,} indexed videos")
+    
+    col1, col2 = st.columns([3, 1])
+    
+    with col1:
+        query = st.text_input("Search titles and tags, or paste a video ID", key="similarity_query")
+    
+    with col2:
+        k = st.number_input("Results", min_value=5, max_value=100, value=20, step=5)
+    
+    if not query:
+        return
+    
+    # A known video ID finds videos like that one; anything else is a text search
+    results = similar_videos(query.strip(), k=k, index=index) or search_videos(query, k=k, index=index)
+    
+    if not results:
+        st.info("No similar videos found.")
+        return
+    
+    st.dataframe(
+        pd.DataFrame(results).rename(columns={
+            'score': 'Similarity',
+            'title': 'Title',
+            'channel_title': 'Channel',
+            'region': 'Region',
+            'date': 'Last Trending',
+            'view_count': 'Views'
+        }),
+        use_container_width=True
+    )
+
 def collect_data_page():
     """Page for collecting new data"""
     
@@ -8,12 +8,42 @@ from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 import isodate
 import time
-import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from config import YOUTUBE_API_KEY, CATEGORIES, REGIONS, MAX_RESULTS
+from trend_store import open_store, ingest_snapshot
+from storage import atomic_write, write_json, partition_lock, record_files
+from similarity_index import update_index
+
+# Retry settings for transient API errors (5xx, 429)
+MAX_RETRIES = 3
+RETRY_BACKOFF = 1.0
+
+class QuotaExceededError(Exception):
+    """The YouTube API refused a request because the daily quota is used up"""
 
 # Initialize YouTube API client
-def get_youtube_client():
-    return build('youtube', 'v3', developerKey=YOUTUBE_API_KEY)
+def get_youtube_client(api_key=YOUTUBE_API_KEY, api_endpoint=None):
+    """Build a YouTube API client, optionally against another endpoint (e.g. a replay server)"""
+    client_options = {'api_endpoint': api_endpoint} if api_endpoint else None
+    return build('youtube', 'v3', developerKey=api_key, client_options=client_options)
+
+def is_quota_error(error):
+    """Whether an HttpError is a quotaExceeded response"""
+    content = error.content.decode('utf-8', 'replace') if isinstance(error.content, bytes) else str(error.content)
+    return error.resp.status == 403 and 'quotaExceeded' in content
+
+def execute_with_retries(request, retries=MAX_RETRIES, backoff=RETRY_BACKOFF):
+    """Execute an API request, retrying transient errors with exponential backoff"""
+    for attempt in range(retries + 1):
+        try:
+            return request.execute()
+        except HttpError as e:
+            if is_quota_error(e):
+                raise QuotaExceededError(str(e)) from e
+            if e.resp.status not in (429, 500, 502, 503, 504) or attempt == retries:
+                raise
+            time.sleep(backoff * (2 ** attempt))
 
 def parse_duration(duration_str):
     """Convert ISO 8601 duration to seconds"""
@@ -22,22 +52,35 @@ def parse_duration(duration_str):
     except:
         return 0
 
-def get_trending_videos(youtube, region_code='US', category_id=None, max_results=MAX_RESULTS):
-    """Fetch trending videos with optional category filter"""
+def get_trending_videos(youtube, region_code='US', category_id=None, max_results=MAX_RESULTS, retry_backoff=RETRY_BACKOFF):
+    """Fetch trending videos with optional category filter
+
+    More than 50 results are fetched by following nextPageToken.
+    """
     try:
-        request = youtube.videos().list(
-            part="snippet,contentDetails,statistics",
-            chart="mostPopular",
-            regionCode=region_code,
-            maxResults=max_results,
-            videoCategoryId=category_id if category_id else ""
-        )
+        items = []
+        page_token = None
         
-        response = request.execute()
+        while len(items) < max_results:
+            request = youtube.videos().list(
+                part="snippet,contentDetails,statistics",
+                chart="mostPopular",
+                regionCode=region_code,
+                maxResults=min(max_results - len(items), 50),
+                videoCategoryId=category_id if category_id else "",
+                pageToken=page_token
+            )
+            
+            response = execute_with_retries(request, backoff=retry_backoff)
+            items.extend(response.get('items', []))
+            
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                break
         
         # Extract relevant information
         videos = []
-        for item in response.get('items', []):
+        for item in items:
             video = {
                 'video_id': item['id'],
                 'title': item['snippet']['title'],
@@ -65,10 +108,57 @@ def get_trending_videos(youtube, region_code='US', category_id=None, max_results
         print(f"An HTTP error occurred: {e}")
         return pd.DataFrame()
 
-def collect_all_trending_data():
+def fetch_all_trending(client_factory=get_youtube_client, regions=REGIONS, categories=CATEGORIES,
+                       workers=1, request_delay=1, retry_backoff=RETRY_BACKOFF, max_results=MAX_RESULTS):
+    """Fetch trending videos for every region/category as {region: {category: DataFrame}}
+
+    With workers > 1 requests run in a thread pool, each thread with its own
+    client (API clients are not thread-safe). Stops early when the quota runs out.
+    """
+    jobs = [(region, cat_id, cat_name) for region in regions for cat_id, cat_name in categories.items()]
+    results = {region: {} for region in regions}
+    local = threading.local()
+    quota_exceeded = threading.Event()
+    
+    def fetch(job):
+        region, cat_id, cat_name = job
+        if quota_exceeded.is_set():
+            return job, pd.DataFrame()
+        
+        if not hasattr(local, 'youtube'):
+            local.youtube = client_factory()
+        
+        print(f"Collecting {cat_name} trends for {region}...")
+        
+        try:
+            # Use empty string for "All" category
+            df = get_trending_videos(local.youtube, region_code=region, category_id=cat_id if cat_id != '0' else "",
+                                     max_results=max_results, retry_backoff=retry_backoff)
+        except QuotaExceededError:
+            print("YouTube API quota exceeded, stopping collection")
+            quota_exceeded.set()
+            df = pd.DataFrame()
+        
+        # Respect YouTube API quotas with a small delay
+        if request_delay:
+            time.sleep(request_delay)
+        
+        return job, df
+    
+    if workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            fetched = list(executor.map(fetch, jobs))
+    else:
+        fetched = [fetch(job) for job in jobs]
+    
+    for (region, _, cat_name), df in fetched:
+        results[region][cat_name] = df
+    
+    return results
+
+def collect_all_trending_data(client_factory=get_youtube_client, workers=1, request_delay=1):
     """Collect trending data for all configured regions and categories"""
     
-    youtube = get_youtube_client()
     today = datetime.now().strftime('%Y-%m-%d')
     
     # Create data directory if it doesn't exist
@@ -76,33 +166,38 @@ def collect_all_trending_data():
         os.makedirs('data')
     
     all_trends = {}
+    written = []
+    
+    fetched = fetch_all_trending(client_factory, workers=workers, request_delay=request_delay)
     
-    for region in REGIONS:
+    for region, region_frames in fetched.items():
         region_trends = {}
         
-        for cat_id, cat_name in CATEGORIES.items():
-            print(f"Collecting {cat_name} trends for {region}...")
-            
-            # Use empty string for "All" category
-            df = get_trending_videos(youtube, region_code=region, category_id=cat_id if cat_id != '0' else "")
-            
+        for cat_name, df in region_frames.items():
             if not df.empty:
                 # Save raw data
                 file_name = f'data/raw_{region}_{cat_name.lower().replace(" & ", "_")}_{today}.csv'
-                df.to_csv(file_name, index=False)
+                with atomic_write(file_name) as f:
+                    df.to_csv(f, index=False)
+                written.append(file_name)
                 print(f"Saved {len(df)} videos to {file_name}")
                 
                 region_trends[cat_name] = df.to_dict('records')
             else:
                 print(f"No data returned for {cat_name} in {region}")
-            
-            # Respect YouTube API quotas with a small delay
-            time.sleep(1)
         
         all_trends[region] = region_trends
     
-    # Save combined data
-    with open(f'data/all_trending_{today}.json', 'w') as f:
-        json.dump(all_trends, f)
+    # Save combined data; the lock keeps concurrent collectors from interleaving
+    with partition_lock(today):
+        write_json(f'data/all_trending_{today}.json', all_trends)
+        record_files(today, written + [f'data/all_trending_{today}.json'])
+        
+        # Make the snapshot queryable (this also updates the channel rollups)
+        with open_store() as conn:
+            ingest_snapshot(conn, all_trends, today)
+    
+    # Add the new videos to the similarity index
+    update_index()
     
-    return all_trends
\ No newline at end of file
+    return all_trends
@@ -0,0 +1,227 @@
+# feature_extractor.py
+# Per-video feature table: title flags, duration bucket, word and tag ids
+
+import os
+import re
+import numpy as np
+from storage import atomic_write
+
+# Location of the persisted feature table
+FEATURES_PATH = 'data/features.npz'
+
+# Duration buckets used for the duration distribution
+DURATION_BINS = [0, 60, 300, 600, 1200, 1800, 3600, float('inf')]
+DURATION_LABELS = ['<1 min', '1-5 min', '5-10 min', '10-20 min', '20-30 min', '30-60 min', '>60 min']
+
+STOP_WORDS = {'the', 'a', 'an', 'and', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by', 'as', 'is', 'are', 'was', 'were', 'be', 'this', 'that', 'my', 'your', 'our', 'their'}
+
+WORD_RE = re.compile(r'\b[a-z]{4,}\b')
+
+def _matches(pattern):
+    """Predicate that searches a title for a case-insensitive regex"""
+    regex = re.compile(pattern, re.I)
+    return lambda t: regex.search(t) is not None
+
+# Title patterns, one bit each in the flag bitset
+TITLE_PATTERNS = [
+    ('question', _matches(r'\?|\bwhy\b|\bhow\b|\bwhat\b')),
+    ('all_caps', lambda t: t.isupper()),
+    ('emoji', lambda t: any(ord(c) > 0x1F000 for c in t)),
+    ('number_in_title', lambda t: re.search(r'\d+', t) is not None),
+    ('exclamation', lambda t: '!' in t),
+    ('parentheses', lambda t: '(' in t and ')' in t),
+    ('brackets', lambda t: '[' in t and ']' in t),
+]
+
+# Video formats, following the title patterns in the flag bitset
+VIDEO_FORMATS = [
+    ('listicle', _matches(r'^\d+\s|\s\d+\s|top\s\d+')),
+    ('reaction', _matches(r'reacting|reaction')),
+    ('tutorial', _matches(r'how to|tutorial|guide')),
+    ('review', _matches(r'review|unboxing')),
+    ('challenge', _matches(r'challenge')),
+    ('day_in_life', _matches(r'day in|day of|day in the life')),
+    ('asmr', _matches(r'asmr')),
+    ('shorts', _matches(r'#shorts|shorts')),
+    ('live', _matches(r'live|stream')),
+    ('podcast', _matches(r'podcast|episode')),
+]
+
+FLAG_NAMES = [name for name, _ in TITLE_PATTERNS + VIDEO_FORMATS]
+PATTERN_NAMES = [name for name, _ in TITLE_PATTERNS]
+FORMAT_NAMES = [name for name, _ in VIDEO_FORMATS]
+
+def title_flags(title):
+    """Bitset of the title patterns and video formats a title matches"""
+    flags = 0
+    for bit, (_, predicate) in enumerate(TITLE_PATTERNS + VIDEO_FORMATS):
+        if predicate(title):
+            flags |= 1 << bit
+    return flags
+
+def title_words(title, stop_words=STOP_WORDS):
+    """Words of a title counted by the common-words analysis"""
+    return [w for w in WORD_RE.findall(title.lower()) if w not in stop_words]
+
+def duration_bucket(seconds):
+    """Index of the duration bucket for a length in seconds (-1 if none)"""
+    # Buckets are right-inclusive like pd.cut, so 0 seconds has no bucket
+    for i in range(len(DURATION_LABELS)):
+        if DURATION_BINS[i] < seconds <= DURATION_BINS[i + 1]:
+            return i
+    return -1
+
+def _gather(offsets, data, rows):
+    """Concatenate the CSR entries of the given rows"""
+    starts = offsets[rows]
+    lengths = offsets[rows + 1] - starts
+    total = int(lengths.sum())
+    if total == 0:
+        return data[:0]
+    # Position of each gathered entry within the data array
+    shift = np.repeat(starts - np.concatenate(([0], np.cumsum(lengths)[:-1])), lengths)
+    return data[shift + np.arange(total)]
+
+def _top_counts(ids, labels, limit):
+    """Most common ids as {label: count}, ties in first-seen order like Counter"""
+    if len(ids) == 0:
+        return {}
+    unique, first_seen, counts = np.unique(ids, return_index=True, return_counts=True)
+    order = np.lexsort((first_seen, -counts))[:limit]
+    return {labels[unique[i]]: int(counts[i]) for i in order}
+
+class FeatureTable:
+    """Columnar features computed once per unique video_id"""
+
+    def __init__(self):
+        self.video_ids = []
+        self.rows = {}
+        self.flags = np.zeros(0, dtype=np.uint32)
+        self.duration_buckets = np.zeros(0, dtype=np.int8)
+        self.word_offsets = np.zeros(1, dtype=np.int64)
+        self.word_ids = np.zeros(0, dtype=np.int32)
+        self.tag_offsets = np.zeros(1, dtype=np.int64)
+        self.tag_ids = np.zeros(0, dtype=np.int32)
+        self.words = []
+        self.tags = []
+        self._word_index = {}
+        self._tag_index = {}
+
+    def __len__(self):
+        return len(self.video_ids)
+
+    @staticmethod
+    def _intern(value, values, index):
+        """Id of a string in a vocabulary, adding it if needed"""
+        if value not in index:
+            index[value] = len(values)
+            values.append(value)
+        return index[value]
+
+    def update(self, videos):
+        """Extract features for videos (dicts) whose video_id is not yet known"""
+        flags, buckets = [], []
+        word_lengths, word_ids = [], []
+        tag_lengths, tag_ids = [], []
+
+        for video in videos:
+            video_id = video['video_id']
+            if video_id in self.rows:
+                continue
+
+            title = video.get('title') or ''
+            words = [self._intern(w, self.words, self._word_index) for w in title_words(title)]
+            tags = [self._intern(t, self.tags, self._tag_index) for t in (video.get('tags') or [])]
+
+            self.rows[video_id] = len(self.video_ids)
+            self.video_ids.append(video_id)
+            flags.append(title_flags(title))
+            buckets.append(duration_bucket(video.get('duration_seconds') or 0))
+            word_lengths.append(len(words))
+            word_ids.extend(words)
+            tag_lengths.append(len(tags))
+            tag_ids.extend(tags)
+
+        if not flags:
+            return 0
+
+        self.flags = np.concatenate([self.flags, np.array(flags, dtype=np.uint32)])
+        self.duration_buckets = np.concatenate([self.duration_buckets, np.array(buckets, dtype=np.int8)])
+        self.word_offsets = np.concatenate([self.word_offsets, self.word_offsets[-1] + np.cumsum(word_lengths)])
+        self.word_ids = np.concatenate([self.word_ids, np.array(word_ids, dtype=np.int32)])
+        self.tag_offsets = np.concatenate([self.tag_offsets, self.tag_offsets[-1] + np.cumsum(tag_lengths)])
+        self.tag_ids = np.concatenate([self.tag_ids, np.array(tag_ids, dtype=np.int32)])
+
+        return len(flags)
+
+    def rows_for(self, video_ids):
+        """Row indices of the given video ids"""
+        return np.fromiter((self.rows[v] for v in video_ids), dtype=np.int64)
+
+    def flag_counts(self, rows):
+        """Number of videos matching each title pattern and video format"""
+        bits = (self.flags[rows, None] >> np.arange(len(FLAG_NAMES), dtype=np.uint32)) & 1
+        counts = bits.sum(axis=0)
+        totals = dict(zip(FLAG_NAMES, (int(c) for c in counts)))
+        return {
+            'patterns': {name: totals[name] for name in PATTERN_NAMES},
+            'formats': {name: totals[name] for name in FORMAT_NAMES},
+        }
+
+    def duration_counts(self, rows):
+        """Number of videos per duration bucket, most common first"""
+        buckets = self.duration_buckets[rows]
+        counts = np.bincount(buckets[buckets >= 0], minlength=len(DURATION_LABELS))
+        order = np.argsort(-counts, kind='stable')
+        return {DURATION_LABELS[i]: int(counts[i]) for i in order}
+
+    def word_counts(self, rows, limit=30):
+        """Most common title words across the given videos"""
+        return _top_counts(_gather(self.word_offsets, self.word_ids, rows), self.words, limit)
+
+    def tag_counts(self, rows, limit=20):
+        """Most common tags across the given videos"""
+        return _top_counts(_gather(self.tag_offsets, self.tag_ids, rows), self.tags, limit)
+
+    def save(self, path=FEATURES_PATH):
+        """Atomically write the table to a .npz file"""
+        with atomic_write(path, 'wb') as f:
+            self._save_arrays(f)
+
+    def _save_arrays(self, f):
+        """Write the table arrays to an open file"""
+        np.savez(
+            f,
+            video_ids=np.array(self.video_ids, dtype=str),
+            flags=self.flags,
+            duration_buckets=self.duration_buckets,
+            word_offsets=self.word_offsets,
+            word_ids=self.word_ids,
+            tag_offsets=self.tag_offsets,
+            tag_ids=self.tag_ids,
+            words=np.array(self.words, dtype=str),
+            tags=np.array(self.tags, dtype=str),
+        )
+
+    @classmethod
+    def load(cls, path=FEATURES_PATH):
+        """Load a saved table, or return an empty one if none exists"""
+        table = cls()
+        if not os.path.exists(path):
+            return table
+
+        with np.load(path) as archive:
+            table.video_ids = archive['video_ids'].tolist()
+            table.flags = archive['flags']
+            table.duration_buckets = archive['duration_buckets']
+            table.word_offsets = archive['word_offsets']
+            table.word_ids = archive['word_ids']
+            table.tag_offsets = archive['tag_offsets']
+            table.tag_ids = archive['tag_ids']
+            table.words = archive['words'].tolist()
+            table.tags = archive['tags'].tolist()
+
+        table.rows = {v: i for i, v in enumerate(table.video_ids)}
+        table._word_index = {w: i for i, w in enumerate(table.words)}
+        table._tag_index = {t: i for i, t in enumerate(table.tags)}
+        return table
@@ -2,10 +2,11 @@
 # Generate AI insights from trend analysis using Pollinations AI
 
 import json
-import os
+import time
 import requests
 from datetime import datetime
 from config import POLLINATIONS_API_URL
+from storage import atomic_write
 
 def generate_basic_insights(category_data):
     """Generate basic insights without using an API (fallback method)"""
@@ -37,24 +38,164 @@ def generate_basic_insights(category_data):
     
     return insights
 
-def generate_insights(analysis_data, region, category):
-    """Generate insights from analysis data using Pollinations AI"""
-    
-    try:
-        # Extract relevant data
-        category_data = analysis_data[region][category]
-        
-        # Create prompt for the API
-        prompt = f"""
-        Analyze these YouTube trends for {category} videos in {region} and identify:
+# Seconds to wait for the insights API before giving up
+REQUEST_TIMEOUT = 120
+
+# Approximate prompt size (tokens) for one batched request
+BATCH_TOKEN_BUDGET = 6000
+
+# System message to guide the AI
+SYSTEM_MESSAGE = "You are a YouTube trend analysis expert."
+
+ANALYSIS_QUESTIONS = """
         1. Emerging video formats or styles
         2. Rising topics or themes
         3. Content opportunities (gaps in the market)
-        4. Unusual patterns or outliers
+        4. Unusual patterns or outliers"""
+
+def estimate_tokens(text):
+    """Rough token count for a prompt (about 4 characters per token)"""
+    return len(text) // 4 + 1
+
+def new_usage_stats():
+    """Counters reported at the end of an insights run"""
+    return {'requests': 0, 'prompt_tokens': 0, 'categories': 0, 'fallbacks': 0}
+
+def _chat_payload(prompt, stream=False):
+    """Request body for the OpenAI-compatible chat endpoint"""
+    payload = {
+        "messages": [
+            {"role": "system", "content": SYSTEM_MESSAGE},
+            {"role": "user", "content": prompt}
+        ]
+    }
+    if stream:
+        payload["stream"] = True
+    return payload
+
+def _post_chat(prompt, usage=None):
+    """Send one chat completion request and return the generated text"""
+    payload = _chat_payload(prompt)
+    
+    response = requests.post(POLLINATIONS_API_URL, json=payload, timeout=REQUEST_TIMEOUT)
+    
+    if usage is not None:
+        usage['requests'] += 1
+        usage['prompt_tokens'] += estimate_tokens(SYSTEM_MESSAGE + prompt)
+    
+    # Check if the request was successful
+    if response.status_code != 200:
+        raise RuntimeError(f"API Error: {response.status_code} - {response.text}")
+    
+    result = response.json()
+    
+    # Extract the generated text (adjust based on actual API response format)
+    if "choices" in result and len(result["choices"]) > 0:
+        return result["choices"][0]["message"]["content"]
+    return result.get("content", "No insights generated")
+
+def insights_path(region, category, date=None):
+    """Path of the cached insights text for a region/category"""
+    if date is None:
+        date = datetime.now().strftime('%Y-%m-%d')
+    return f'data/insights/{date}_{region}_{category.replace(" & ", "_")}.txt'
+
+def save_insights(insights, region, category, date=None):
+    """Write insights text to the insights cache"""
+    with atomic_write(insights_path(region, category, date)) as f:
+        f.write(insights)
+
+def compact_category_summary(category_data):
+    """Compact subset of a category analysis used in batched prompts"""
+    return {
+        'videos': category_data['stats']['total_videos'],
+        'avg_views': category_data['stats']['avg_views'],
+        'median_views': category_data['stats'].get('median_views'),
+        'avg_duration_s': category_data['stats']['avg_duration'],
+        'formats': {k: v for k, v in category_data['video_formats'].items() if v},
+        'patterns': {k: v for k, v in category_data['title_patterns'].items() if v},
+        'words': dict(list(category_data['common_words'].items())[:10]),
+        'tags': dict(list(category_data['top_tags'].items())[:10]),
+        'durations': {k: v for k, v in category_data['duration_distribution'].items() if v},
+        'channels': dict(list(category_data['top_channels'].items())[:5]),
+        'outliers': [
+            {'title': o['title'], 'views': o['view_count'], 'why': o['reasons']}
+            for o in category_data.get('outliers', [])[:3]
+        ],
+        'rising': [
+            f"{c['dimension']}:{c['item']} {c['expected']}->{c['count']}"
+            for c in category_data.get('emerging', {}).get('rising', [])[:5]
+        ],
+        'falling': [
+            f"{c['dimension']}:{c['item']} {c['expected']}->{c['count']}"
+            for c in category_data.get('emerging', {}).get('falling', [])[:5]
+        ],
+    }
+
+def build_batch_prompt(region, summaries):
+    """Prompt covering several categories of one region in a single request"""
+    data = json.dumps(summaries, separators=(',', ':'), ensure_ascii=False)
+    
+    return f"""Analyze these YouTube trends in {region}. For EACH category identify:{ANALYSIS_QUESTIONS}
+
+Trend data per category (JSON):
+{data}
+
+Reply with ONLY a JSON object mapping each category name to a markdown string with clear sections for the four points above. Focus on actionable insights for content creators."""
+
+def parse_batch_response(text, categories):
+    """Split a batched reply into {category: insights}; missing entries are left out"""
+    text = text.strip()
+    
+    # Drop a markdown code fence around the JSON, if any
+    if text.startswith('```'):
+        text = text.split('\n', 1)[1] if '\n' in text else ''
+        text = text.rsplit('```', 1)[0]
+    
+    start, end = text.find('{'), text.rfind('}')
+    if start == -1 or end == -1:
+        return {}
+    
+    try:
+        parsed = json.loads(text[start:end + 1])
+    except json.JSONDecodeError:
+        return {}
+    
+    if not isinstance(parsed, dict):
+        return {}
+    
+    return {c: parsed[c] for c in categories if isinstance(parsed.get(c), str) and parsed[c].strip()}
+
+def pack_batches(analysis_data, region, token_budget=BATCH_TOKEN_BUDGET):
+    """Group a region's categories into batches that fit the token budget"""
+    batches = []
+    current, current_tokens = {}, 0
+    
+    for category, category_data in analysis_data[region].items():
+        summary = compact_category_summary(category_data)
+        tokens = estimate_tokens(json.dumps(summary, separators=(',', ':'), ensure_ascii=False))
+        
+        if current and current_tokens + tokens > token_budget:
+            batches.append(current)
+            current, current_tokens = {}, 0
+        
+        current[category] = summary
+        current_tokens += tokens
+    
+    if current:
+        batches.append(current)
+    
+    return batches
+
+def build_category_prompt(category_data, region, category):
+    """Prompt for the insights of a single region/category"""
+    return f"""
+        Analyze these YouTube trends for {category} videos in {region} and identify:{ANALYSIS_QUESTIONS}
         
         Trend data:
         - Total videos analyzed: {category_data['stats']['total_videos']}
         - Average views: {category_data['stats']['avg_views']}
+        - Median views: {category_data['stats'].get('median_views', 'n/a')}
         - Average duration: {category_data['stats']['avg_duration']} seconds
         
         Popular video formats:
@@ -75,46 +216,30 @@ def generate_insights(analysis_data, region, category):
         Top channels:
         {json.dumps(category_data['top_channels'], indent=2)}
         
+        Outliers flagged by engagement scoring (base the "unusual patterns" section on these):
+        {json.dumps(category_data.get('outliers', []), indent=2)}
+        
+        Rising and falling items compared with previous snapshots (base "emerging" and "rising" on these):
+        {json.dumps(category_data.get('emerging', {}), indent=2)}
+        
         Provide your analysis in a structured format with clear sections for each category.
         Focus on actionable insights for content creators.
         """
+
+def generate_insights(analysis_data, region, category, usage=None, date=None):
+    """Generate insights from analysis data using Pollinations AI"""
+    
+    try:
+        # Extract relevant data
+        category_data = analysis_data[region][category]
         
-        # System message to guide the AI
-        system_message = "You are a YouTube trend analysis expert."
-        
-        # Prepare the request to Pollinations AI
-        payload = {
-            "messages": [
-                {"role": "system", "content": system_message},
-                {"role": "user", "content": prompt}
-            ]
-        }
-        
-        # Make the POST request to Pollinations AI
-        response = requests.post(POLLINATIONS_API_URL, json=payload)
+        # Create prompt for the API
+        prompt = build_category_prompt(category_data, region, category)
         
-        # Check if the request was successful
-        if response.status_code == 200:
-            # Parse the response
-            result = response.json()
-            
-            # Extract the generated text (adjust based on actual API response format)
-            if "choices" in result and len(result["choices"]) > 0:
-                insights = result["choices"][0]["message"]["content"]
-            else:
-                insights = result.get("content", "No insights generated")
-        else:
-            print(f"API Error: {response.status_code} - {response.text}")
-            return generate_basic_insights(category_data)
+        insights = _post_chat(prompt, usage)
         
         # Save insights
-        insights_dir = 'data/insights'
-        if not os.path.exists(insights_dir):
-            os.makedirs(insights_dir)
-            
-        date = datetime.now().strftime('%Y-%m-%d')
-        with open(f'{insights_dir}/{date}_{region}_{category.replace(" & ", "_")}.txt', 'w') as f:
-            f.write(insights)
+        save_insights(insights, region, category, date)
         
         return insights
     
@@ -123,19 +248,126 @@ def generate_insights(analysis_data, region, category):
         print("Falling back to basic insights generation...")
         return generate_basic_insights(category_data)
 
-def generate_all_insights(analysis_data):
-    """Generate insights for all regions and categories"""
+def _stream_deltas(response):
+    """Yield content deltas from a server-sent events chat completion stream
+    
+    Raises RuntimeError if the stream ends before [DONE] or a finish_reason.
+    """
+    response.encoding = 'utf-8'
+    finished = False
+    
+    for line in response.iter_lines(chunk_size=None, decode_unicode=True):
+        if not line or not line.startswith('data:'):
+            continue
+        
+        data = line[len('data:'):].strip()
+        if data == '[DONE]':
+            return
+        
+        chunk = json.loads(data)
+        choice = (chunk.get('choices') or [{}])[0]
+        content = (choice.get('delta') or {}).get('content')
+        if content:
+            yield content
+        finished = finished or bool(choice.get('finish_reason'))
+    
+    if not finished:
+        raise RuntimeError("Stream closed before the response was complete")
+
+def stream_insights(analysis_data, region, category, date=None, metrics=None):
+    """Yield insight text as it is generated, caching the full text at the end"""
+    
+    if metrics is None:
+        metrics = {}
+    
+    category_data = analysis_data[region][category]
+    prompt = build_category_prompt(category_data, region, category)
+    
+    chunks = []
+    start = time.perf_counter()
+    metrics['time_to_first_token'] = None
+    
+    try:
+        payload = _chat_payload(prompt, stream=True)
+        
+        with requests.post(POLLINATIONS_API_URL, json=payload, stream=True, timeout=REQUEST_TIMEOUT) as response:
+            if response.status_code != 200:
+                raise RuntimeError(f"API Error: {response.status_code} - {response.text}")
+            
+            for content in _stream_deltas(response):
+                if metrics['time_to_first_token'] is None:
+                    metrics['time_to_first_token'] = time.perf_counter() - start
+                chunks.append(content)
+                yield content
+    
+    except Exception as e:
+        print(f"Error streaming insights: {e}")
+        if not chunks:
+            print("Falling back to basic insights generation...")
+            yield generate_basic_insights(category_data)
+        # Partial or fallback text is not cached
+        return
+    
+    finally:
+        metrics['total_time'] = time.perf_counter() - start
+    
+    insights = ''.join(chunks)
+    if insights:
+        save_insights(insights, region, category, date)
+
+def generate_region_insights(analysis_data, region, usage=None, token_budget=BATCH_TOKEN_BUDGET, date=None):
+    """Generate insights for all categories of a region with batched prompts"""
+    
+    if usage is None:
+        usage = new_usage_stats()
+    
+    region_insights = {}
+    
+    for batch in pack_batches(analysis_data, region, token_budget):
+        categories = list(batch.keys())
+        print(f"Generating insights for {', '.join(categories)} in {region}...")
+        
+        try:
+            parsed = parse_batch_response(_post_chat(build_batch_prompt(region, batch), usage), categories)
+        except Exception as e:
+            print(f"Error generating batched insights: {e}")
+            parsed = {}
+        
+        for category in categories:
+            if category in parsed:
+                save_insights(parsed[category], region, category, date)
+                region_insights[category] = parsed[category]
+            else:
+                # The batched reply could not be used for this category
+                usage['fallbacks'] += 1
+                region_insights[category] = generate_insights(analysis_data, region, category, usage, date)
+    
+    return region_insights
+
+def generate_all_insights(analysis_data, batch=True, token_budget=BATCH_TOKEN_BUDGET, date=None):
+    """Generate insights for all regions and categories of the analysis for date (default today)"""
     
     all_insights = {}
+    usage = new_usage_stats()
     
     for region in analysis_data.keys():
+        usage['categories'] += len(analysis_data[region])
+        
+        if batch:
+            all_insights[region] = generate_region_insights(analysis_data, region, usage, token_budget, date)
+            continue
+        
         region_insights = {}
         
         for category in analysis_data[region].keys():
             print(f"Generating insights for {category} in {region}...")
-            insights = generate_insights(analysis_data, region, category)
+            insights = generate_insights(analysis_data, region, category, usage, date)
             region_insights[category] = insights
         
         all_insights[region] = region_insights
     
-    return all_insights
\ No newline at end of file
+    print(f"Insights: {usage['requests']} requests, ~{usage['prompt_tokens']} prompt tokens sent, "
+          f"{max(usage['categories'] - usage['requests'], 0)} requests saved "
+          f"({usage['fallbacks']} single-category fallbacks)")
+    
+    return all_insights
@@ -1,14 +1,15 @@
 # main.py - updated version
 # Main execution script for YouTube Trend Analyzer
+#
+# Heavy modules (googleapiclient, pandas, numpy, requests) are imported inside
+# the command that needs them so that `--help` and `--dashboard` start fast.
+# Check the startup cost with:
+#   python -X importtime main.py --help 2> importtime.log
 
 import argparse
-import os
 import subprocess
 import sys
 from datetime import datetime
-from data_collector import collect_all_trending_data
-from trend_analyzer import analyze_all_trending_data
-from llm_insights import generate_all_insights
 
 def run_dashboard_properly():
     """Run the dashboard using streamlit run command"""
@@ -16,61 +17,97 @@ def run_dashboard_properly():
     # Use subprocess to run streamlit properly
     subprocess.run([sys.executable, "-m", "streamlit", "run", "dashboard.py"])
 
-def main():
-    """Main function to run the YouTube Trend Analyzer"""
-    
+def run_collect():
+    """Collect trending data for all regions and categories"""
+    from data_collector import collect_all_trending_data
+
+    print("Collecting trending data...")
+    collect_all_trending_data()
+    print("Data collection complete!")
+
+def run_analyze(date):
+    """Analyze the collected data for a date"""
+    from trend_analyzer import analyze_all_trending_data
+
+    print("Analyzing trending data...")
+    analysis = analyze_all_trending_data(date)
+
+    if analysis:
+        print(f"Analysis complete! Results saved to data/analysis_{date}.json")
+    else:
+        print(f"No data found for {date}")
+
+def run_insights(date, batch=True):
+    """Generate AI insights for an analyzed date"""
+    from llm_insights import generate_all_insights
+    from trend_store import open_store, load_analysis
+
+    print("Generating AI insights with Pollinations AI...")
+
+    with open_store() as conn:
+        analysis_data = load_analysis(conn, date)
+
+    if not analysis_data:
+        print(f"No analysis data found for {date}")
+        return
+
+    generate_all_insights(analysis_data, batch=batch, date=date)
+    print("Insights generation complete!")
+
+def run_retention():
+    """Compact older data into compressed archives"""
+    from retention import apply_retention
+
+    print("Applying data retention...")
+    summary = apply_retention()
+    print(f"Archived {summary['daily']} dates into daily archives and {summary['weekly']} into weekly archives")
+
+def build_parser():
+    """Build the command line parser"""
     parser = argparse.ArgumentParser(description='YouTube Trend Analyzer')
     parser.add_argument('--collect', action='store_true', help='Collect trending data')
     parser.add_argument('--analyze', action='store_true', help='Analyze collected data')
     parser.add_argument('--insights', action='store_true', help='Generate AI insights')
     parser.add_argument('--dashboard', action='store_true', help='Run the dashboard')
+    parser.add_argument('--no-batch', action='store_true', help='Send one insights prompt per category instead of batching')
+    parser.add_argument('--retention', action='store_true', help='Compact older data into compressed archives')
     parser.add_argument('--date', type=str, help='Date to analyze (YYYY-MM-DD)')
-    
+    return parser
+
+def main():
+    """Main function to run the YouTube Trend Analyzer"""
+
+    parser = build_parser()
     args = parser.parse_args()
-    
+
     # If no arguments provided, show help and run dashboard
     if not any(vars(args).values()):
         parser.print_help()
         print("\nRunning dashboard by default...\n")
         run_dashboard_properly()
         return
-    
+
+    date = args.date or datetime.now().strftime('%Y-%m-%d')
+
     # Collect data
     if args.collect:
-        print("Collecting trending data...")
-        collect_all_trending_data()
-        print("Data collection complete!")
-    
+        run_collect()
+
     # Analyze data
     if args.analyze:
-        print("Analyzing trending data...")
-        date = args.date or datetime.now().strftime('%Y-%m-%d')
-        analysis = analyze_all_trending_data(date)
-        
-        if analysis:
-            print(f"Analysis complete! Results saved to data/analysis_{date}.json")
-        else:
-            print(f"No data found for {date}")
-    
+        run_analyze(date)
+
     # Generate insights
     if args.insights:
-        print("Generating AI insights with Pollinations AI...")
-        date = args.date or datetime.now().strftime('%Y-%m-%d')
-        
-        try:
-            with open(f'data/analysis_{date}.json', 'r') as f:
-                import json
-                analysis_data = json.load(f)
-                
-                insights = generate_all_insights(analysis_data)
-                print("Insights generation complete!")
-        
-        except FileNotFoundError:
-            print(f"No analysis data found for {date}")
-    
+        run_insights(date, batch=not args.no_batch)
+
+    # Compact older data
+    if args.retention:
+        run_retention()
+
     # Run dashboard
     if args.dashboard:
         run_dashboard_properly()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,257 @@
+# mock_youtube.py
+# Fake YouTube Data API for offline load testing of the collector
+#
+# FakeYouTubeAPI serves recorded or synthetic mostPopular responses with
+# configurable latency, error rate, quota exhaustion and pagination.
+# FakeYouTubeClient exposes it with the googleapiclient interface
+# (youtube.videos().list(...).execute()); ReplayServer exposes it over HTTP
+# so a real client can be pointed at it with get_youtube_client(api_endpoint=...).
+
+import argparse
+import io
+import json
+import random
+import threading
+import time
+from contextlib import redirect_stdout
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+from config import CATEGORIES
+
+def synthetic_item(region, category_id, index):
+    """A deterministic API item for one synthetic trending video"""
+    rng = random.Random(f'{region}-{category_id}-{index}')
+    views = int(rng.lognormvariate(12, 1.5))
+
+    return {
+        'id': f'{region}{category_id or 0}v{index:04d}',
+        'snippet': {
+            'title': f'Synthetic trending video {index} {rng.choice(["review", "live", "how to", "reaction", "challenge"])}',
+            'channelTitle': f'Channel {rng.randint(0, 200)}',
+            'channelId': f'UC{rng.randint(0, 200):06d}',
+            'publishedAt': '2024-01-01T00:00:00Z',
+            'tags': rng.sample(['music', 'gaming', 'funny', 'tech', 'vlog', 'news', 'sports'], rng.randint(0, 4)),
+            'description': '',
+            'categoryId': category_id or '24',
+            'thumbnails': {'high': {'url': f'https://i.ytimg.com/vi/{region}{index}/hqdefault.jpg'}},
+        },
+        'contentDetails': {'duration': f'PT{rng.randint(0, 90)}M{rng.randint(0, 59)}S'},
+        'statistics': {
+            'viewCount': str(views),
+            'likeCount': str(int(views * rng.uniform(0, 0.08))),
+            'commentCount': str(int(views * rng.uniform(0, 0.01))),
+        },
+    }
+
+def snapshot_item(video):
+    """Convert a collected video record back into an API item"""
+    return {
+        'id': video['video_id'],
+        'snippet': {
+            'title': video['title'],
+            'channelTitle': video['channel_title'],
+            'channelId': video['channel_id'],
+            'publishedAt': video['publish_date'],
+            'tags': video.get('tags') or [],
+            'description': video.get('description') or '',
+            'categoryId': video['category_id'],
+            'thumbnails': {'high': {'url': video.get('thumbnail_url', '')}},
+        },
+        'contentDetails': {'duration': video['duration']},
+        'statistics': {
+            'viewCount': str(video['view_count']),
+            'likeCount': str(video['like_count']),
+            'commentCount': str(video['comment_count']),
+        },
+    }
+
+def _error_body(status, reason, message):
+    """Error response body in the YouTube API format"""
+    return {'error': {'code': status, 'message': message, 'errors': [{'reason': reason, 'message': message}]}}
+
+class FakeYouTubeAPI:
+    """Backend answering videos.list(chart=mostPopular) requests"""
+
+    def __init__(self, items=None, videos_per_chart=200, latency=0.0, error_rate=0.0,
+                 quota_limit=None, seed=0):
+        # items: {(region, category_id): [api items]}; missing charts are synthesized
+        self.items = items or {}
+        self.videos_per_chart = videos_per_chart
+        self.latency = latency
+        self.error_rate = error_rate
+        self.quota_limit = quota_limit
+        self.requests = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_snapshot(cls, path, **kwargs):
+        """Replay a recorded data/all_trending_{date}.json snapshot"""
+        with open(path, 'r') as f:
+            all_trends = json.load(f)
+
+        category_ids = {name: cat_id for cat_id, name in CATEGORIES.items()}
+        items = {}
+        for region, region_data in all_trends.items():
+            for category, videos in region_data.items():
+                cat_id = category_ids.get(category, '0')
+                items[(region, '' if cat_id == '0' else cat_id)] = [snapshot_item(v) for v in videos]
+
+        return cls(items=items, **kwargs)
+
+    def chart(self, region, category_id):
+        """All items of one trending chart"""
+        key = (region, category_id or '')
+        if key not in self.items:
+            self.items[key] = [synthetic_item(region, category_id, i) for i in range(self.videos_per_chart)]
+        return self.items[key]
+
+    def handle(self, params):
+        """Answer one request; returns (HTTP status, response body)"""
+        with self._lock:
+            self.requests += 1
+            count = self.requests
+            failed = self._rng.random() < self.error_rate
+
+        if self.latency:
+            time.sleep(self.latency)
+
+        if self.quota_limit is not None and count > self.quota_limit:
+            return 403, _error_body(403, 'quotaExceeded', 'The request cannot be completed because you have exceeded your quota.')
+        if failed:
+            return 503, _error_body(503, 'backendError', 'Backend Error')
+
+        items = self.chart(params.get('regionCode', 'US'), params.get('videoCategoryId', ''))
+        max_results = min(int(params.get('maxResults', 5)), 50)
+        offset = int(params.get('pageToken') or 0)
+
+        body = {
+            'kind': 'youtube#videoListResponse',
+            'items': items[offset:offset + max_results],
+            'pageInfo': {'totalResults': len(items), 'resultsPerPage': max_results},
+        }
+        if offset + max_results < len(items):
+            body['nextPageToken'] = str(offset + max_results)
+
+        return 200, body
+
+class _FakeRequest:
+    """Stand-in for a googleapiclient HttpRequest"""
+
+    def __init__(self, api, params):
+        self.api = api
+        self.params = params
+        self.uri = 'fake://youtube/v3/videos'
+
+    def execute(self):
+        status, body = self.api.handle(self.params)
+        if status != 200:
+            raise HttpError(httplib2.Response({'status': status}), json.dumps(body).encode(), uri=self.uri)
+        return body
+
+class _FakeVideos:
+    def __init__(self, api):
+        self.api = api
+
+    def list(self, **params):
+        return _FakeRequest(self.api, {k: v for k, v in params.items() if v is not None})
+
+class FakeYouTubeClient:
+    """In-process client with the same interface as build('youtube', 'v3')"""
+
+    def __init__(self, api=None):
+        self.api = api or FakeYouTubeAPI()
+
+    def videos(self):
+        return _FakeVideos(self.api)
+
+class ReplayServer:
+    """Local HTTP server speaking the /youtube/v3/videos endpoint"""
+
+    def __init__(self, api=None, host='127.0.0.1', port=0):
+        self.api = api or FakeYouTubeAPI()
+        backend = self.api
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                if not url.path.endswith('/youtube/v3/videos'):
+                    status, body = 404, _error_body(404, 'notFound', 'Not Found')
+                else:
+                    params = {k: v[0] for k, v in parse_qs(url.query).items()}
+                    status, body = backend.handle(params)
+
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        """Serve in a background thread"""
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+def benchmark(workers=8, rounds=10, latency=0.0, error_rate=0.0, quota_limit=None, max_results=200):
+    """Time fetch_all_trending against the in-process fake API"""
+    from data_collector import fetch_all_trending
+
+    api = FakeYouTubeAPI(latency=latency, error_rate=error_rate, quota_limit=quota_limit)
+    start = time.perf_counter()
+    videos = 0
+
+    for _ in range(rounds):
+        # Keep the collector's progress output out of the timing
+        with redirect_stdout(io.StringIO()):
+            results = fetch_all_trending(lambda: FakeYouTubeClient(api), workers=workers, request_delay=0,
+                                         retry_backoff=0, max_results=max_results)
+        videos += sum(len(df) for region_frames in results.values() for df in region_frames.values())
+
+    elapsed = time.perf_counter() - start
+    return {
+        'requests': api.requests,
+        'videos': videos,
+        'seconds': round(elapsed, 3),
+        'requests_per_second': round(api.requests / elapsed, 1),
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Fake YouTube API for offline load testing')
+    parser.add_argument('--serve', action='store_true', help='Run the replay server')
+    parser.add_argument('--port', type=int, default=8765, help='Replay server port')
+    parser.add_argument('--snapshot', type=str, help='Replay a recorded all_trending_*.json file')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds of latency per request')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests failing with 503')
+    parser.add_argument('--quota', type=int, help='Requests allowed before quotaExceeded')
+    parser.add_argument('--workers', type=int, default=8, help='Collector threads for the benchmark')
+    parser.add_argument('--rounds', type=int, default=10, help='Full collections per benchmark')
+    args = parser.parse_args()
+
+    if args.serve:
+        options = dict(latency=args.latency, error_rate=args.error_rate, quota_limit=args.quota)
+        api = FakeYouTubeAPI.from_snapshot(args.snapshot, **options) if args.snapshot else FakeYouTubeAPI(**options)
+        server = ReplayServer(api, port=args.port)
+        print(f"Serving fake YouTube API at {server.url}/youtube/v3/videos")
+        server.server.serve_forever()
+    else:
+        print(benchmark(args.workers, args.rounds, args.latency, args.error_rate, args.quota))
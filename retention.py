@@ -0,0 +1,226 @@
+# retention.py
+# Compact older snapshots into compressed archives and keep the catalog current
+#
+# Tiers, by age of the date partition:
+#   raw    - every file as written by the collector and analyzer
+#   daily  - raw CSVs and the all_trending JSON packed into archive/<date>.tar.gz
+#   weekly - everything left for the date merged into archive/<year>-W<week>.tar.gz,
+#            which also holds a summed analysis for the whole week; the date's
+#            video records in the query store lose their descriptions and
+#            thumbnails (the archive keeps the full snapshot)
+
+import glob
+import io
+import json
+import os
+import tarfile
+from collections import Counter
+from datetime import datetime, timedelta
+
+from config import RETENTION_RAW_DAYS, RETENTION_DAILY_DAYS
+from storage import DATA_DIR, atomic_write, partition_lock
+from trend_store import open_store, catalog_entries, catalog_entry, load_analysis, set_tier, prune_snapshot
+from shared_results import shared_path
+
+ARCHIVE_DIR = os.path.join(DATA_DIR, 'archive')
+
+def raw_files(date):
+    """Files the collector writes for a date"""
+    return sorted(glob.glob(os.path.join(DATA_DIR, f'raw_*_{date}.csv'))) + \
+        [p for p in [os.path.join(DATA_DIR, f'all_trending_{date}.json')] if os.path.exists(p)]
+
+def derived_files(date):
+    """Files the analyzer and insights generator write for a date"""
+    paths = [os.path.join(DATA_DIR, name) for name in (
+        f'analysis_{date}.json', f'comparison_{date}.npz', f'manifest_{date}.json'
+    )]
+    paths += glob.glob(os.path.join(DATA_DIR, 'insights', f'{date}_*.txt'))
+    return [p for p in paths if os.path.exists(p)]
+
+def week_of(date):
+    """ISO week partition name of a date, e.g. 2024-W07"""
+    year, week, _ = datetime.strptime(date, '%Y-%m-%d').isocalendar()
+    return f'{year}-W{week:02d}'
+
+def _arcname(path):
+    """Name of a data file inside an archive"""
+    return os.path.relpath(path, DATA_DIR)
+
+def _read_members(archive_path):
+    """All members of an archive as {name: bytes}"""
+    if not archive_path or not os.path.exists(archive_path):
+        return {}
+    with tarfile.open(archive_path, 'r:gz') as tar:
+        return {m.name: tar.extractfile(m).read() for m in tar.getmembers() if m.isfile()}
+
+def _write_archive(archive_path, members):
+    """Atomically write {name: bytes} as a gzip-compressed tar archive"""
+    # Small derived files go first so single-member reads stop before the raw snapshots
+    order = sorted(members, key=lambda name: (name.startswith(('raw_', 'all_trending_')), name))
+    with atomic_write(archive_path, 'wb') as f:
+        with tarfile.open(fileobj=f, mode='w:gz') as tar:
+            for name in order:
+                data = members[name]
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                tar.addfile(info, io.BytesIO(data))
+
+def _files_as_members(paths):
+    """Read files into {archive name: bytes}"""
+    members = {}
+    for path in paths:
+        with open(path, 'rb') as f:
+            members[_arcname(path)] = f.read()
+    return members
+
+def _sum_counts(dicts):
+    """Sum {label: count} dicts, most common first"""
+    total = Counter()
+    for d in dicts:
+        total.update(d)
+    return dict(total.most_common())
+
+def aggregate_analyses(analyses):
+    """Combine several {region: {category: analysis}} results into one by summing counts"""
+    grouped = {}
+    for analysis in analyses:
+        for region, region_analysis in analysis.items():
+            for category, category_analysis in region_analysis.items():
+                grouped.setdefault(region, {}).setdefault(category, []).append(category_analysis)
+
+    aggregate = {}
+    for region, region_analysis in grouped.items():
+        aggregate[region] = {}
+        for category, items in region_analysis.items():
+            total_videos = sum(a['stats']['total_videos'] for a in items)
+            weighted = lambda key: int(sum(a['stats'][key] * a['stats']['total_videos'] for a in items) / max(total_videos, 1))
+
+            aggregate[region][category] = {
+                'stats': {
+                    'total_videos': total_videos,
+                    'avg_views': weighted('avg_views'),
+                    'avg_likes': weighted('avg_likes'),
+                    'avg_comments': weighted('avg_comments'),
+                    'avg_duration': weighted('avg_duration'),
+                },
+                'duration_distribution': _sum_counts(a['duration_distribution'] for a in items),
+                'title_patterns': _sum_counts(a['title_patterns'] for a in items),
+                'video_formats': _sum_counts(a['video_formats'] for a in items),
+                'common_words': dict(list(_sum_counts(a['common_words'] for a in items).items())[:30]),
+                'top_tags': dict(list(_sum_counts(a['top_tags'] for a in items).items())[:20]),
+                'top_channels': dict(list(_sum_counts(a['top_channels'] for a in items).items())[:10]),
+                'days': len(items),
+            }
+
+    return aggregate
+
+def compact_daily(conn, date):
+    """Pack a date's raw files into archive/<date>.tar.gz and remove them"""
+    archive_path = os.path.join(ARCHIVE_DIR, f'{date}.tar.gz')
+
+    with partition_lock(date):
+        paths = raw_files(date)
+        if not paths:
+            return False
+
+        members = _read_members(archive_path)
+        members.update(_files_as_members(paths))
+        _write_archive(archive_path, members)
+
+        for path in paths:
+            os.remove(path)
+
+        set_tier(conn, date, 'daily', archive_path)
+
+    return True
+
+def compact_weekly(conn, dates):
+    """Merge the remaining files of dates in one ISO week into archive/<week>.tar.gz"""
+    week = week_of(dates[0])
+    archive_path = os.path.join(ARCHIVE_DIR, f'{week}.tar.gz')
+
+    with partition_lock(week):
+        members = _read_members(archive_path)
+
+        for date in dates:
+            with partition_lock(date):
+                entry = catalog_entry(conn, date)
+                daily_archive = entry['location'] if entry and entry['tier'] == 'daily' else None
+
+                members.update(_read_members(daily_archive))
+                members.update(_files_as_members(raw_files(date) + derived_files(date)))
+
+        # Weekly aggregate over every analyzed date of the week (the store keeps the analyses)
+        week_dates = {e['date'] for e in catalog_entries(conn) if week_of(e['date']) == week and e['has_analysis']}
+        analyses = [load_analysis(conn, date) for date in sorted(week_dates)]
+        members['weekly_aggregate.json'] = json.dumps(aggregate_analyses(analyses)).encode()
+        _write_archive(archive_path, members)
+
+        # Only remove the originals once the weekly archive is in place
+        for date in dates:
+            with partition_lock(date):
+                entry = catalog_entry(conn, date)
+                for path in raw_files(date) + derived_files(date):
+                    os.remove(path)
+                if entry and entry['tier'] == 'daily' and entry['location'] and os.path.exists(entry['location']):
+                    os.remove(entry['location'])
+                # Shared analysis files are rebuilt from the store on demand, so they are not archived
+                if os.path.exists(shared_path(date)):
+                    os.remove(shared_path(date))
+                set_tier(conn, date, 'weekly', archive_path)
+                if f'all_trending_{date}.json' in members:
+                    prune_snapshot(conn, date)
+
+    return archive_path
+
+def apply_retention(today=None, raw_days=RETENTION_RAW_DAYS, daily_days=RETENTION_DAILY_DAYS):
+    """Move date partitions to older tiers according to their age"""
+    today = datetime.strptime(today, '%Y-%m-%d') if today else datetime.now()
+    daily_cutoff = (today - timedelta(days=raw_days)).strftime('%Y-%m-%d')
+    weekly_cutoff = (today - timedelta(days=daily_days)).strftime('%Y-%m-%d')
+
+    summary = {'daily': 0, 'weekly': 0}
+
+    with open_store() as conn:
+        weeks = {}
+
+        for entry in catalog_entries(conn):
+            date = entry['date']
+
+            if date < weekly_cutoff and entry['tier'] != 'weekly':
+                weeks.setdefault(week_of(date), []).append(date)
+            elif date < daily_cutoff and entry['tier'] == 'raw':
+                if compact_daily(conn, date):
+                    summary['daily'] += 1
+
+        for dates in weeks.values():
+            compact_weekly(conn, dates)
+            summary['weekly'] += len(dates)
+        
+        if weeks:
+            # Give the pages freed by pruned video records back to the file system
+            conn.execute('VACUUM')
+
+    return summary
+
+def _read_member(archive_path, name):
+    """One member of an archive (None if absent), decompressing only up to it"""
+    if not os.path.exists(archive_path):
+        return None
+    with tarfile.open(archive_path, 'r:gz') as tar:
+        for member in tar:
+            if member.name == name and member.isfile():
+                return tar.extractfile(member).read()
+    return None
+
+def read_archived_file(conn, date, name):
+    """Contents of a data file (path relative to data/) that retention archived, or None"""
+    entry = catalog_entry(conn, date)
+    if not entry or not entry['location']:
+        return None
+
+    # Daily archives only hold the collector's raw files
+    if entry['tier'] == 'daily' and not name.startswith(('raw_', 'all_trending_')):
+        return None
+
+    return _read_member(entry['location'], name)
@@ -0,0 +1,302 @@
+# shared_results.py
+# Analysis results published as one memory-mappable file per date
+#
+# Dashboard sessions and worker processes map data/shared/analysis_{date}.bin
+# read-only, so they share the operating system's page cache instead of each
+# parsing analysis_{date}.json into its own dicts. Only the category a page
+# actually shows is decoded, and only for as long as the page needs it.
+#
+# File layout: an 8-byte magic, an 8-byte header length, a JSON header giving
+# the dtype, shape and offset of each array, then the arrays (64-byte aligned):
+#   strings, string_offsets  - UTF-8 string table (regions, categories, keys)
+#   groups, group_entries    - (region, category) string ids and their entry ranges
+#   entry_section, entry_key,
+#   entry_value              - one row per count in the count sections
+#   extras, extra_offsets    - the remaining fields of each group as JSON
+
+import argparse
+import json
+import multiprocessing
+import os
+from collections.abc import Mapping
+
+import numpy as np
+
+from storage import DATA_DIR, atomic_write, partition_lock
+
+SHARED_DIR = os.path.join(DATA_DIR, 'shared')
+
+MAGIC = b'YTSHARE1'
+ALIGNMENT = 64
+
+# {label: count} sections stored as columns; everything else goes into extras
+COUNT_SECTIONS = ['duration_distribution', 'title_patterns', 'video_formats', 'common_words', 'top_tags', 'top_channels']
+
+def shared_path(date):
+    """Path of the shared analysis file of a date"""
+    return os.path.join(SHARED_DIR, f'analysis_{date}.bin')
+
+def _byte_blob(items):
+    """Concatenate byte strings into a uint8 blob plus offsets"""
+    offsets = np.zeros(len(items) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(b) for b in items])
+    return np.frombuffer(b''.join(items), dtype=np.uint8), offsets
+
+def build_arrays(analysis_results):
+    """Encode {region: {category: analysis}} into the shared file's arrays"""
+    string_ids = {}
+    def sid(text):
+        return string_ids.setdefault(text, len(string_ids))
+
+    groups, group_entries, extras = [], [0], []
+    sections, keys, values = [], [], []
+
+    for region, region_analysis in analysis_results.items():
+        for category, category_analysis in region_analysis.items():
+            groups.append((sid(region), sid(category)))
+
+            present = []
+            for section_id, section in enumerate(COUNT_SECTIONS):
+                if section not in category_analysis:
+                    continue
+                present.append(section)
+                for key, value in category_analysis[section].items():
+                    sections.append(section_id)
+                    keys.append(sid(str(key)))
+                    values.append(value)
+            group_entries.append(len(keys))
+
+            rest = {k: v for k, v in category_analysis.items() if k not in COUNT_SECTIONS}
+            rest['_sections'] = present
+            extras.append(json.dumps(rest, default=str).encode('utf-8'))
+
+    strings, string_offsets = _byte_blob([s.encode('utf-8') for s in string_ids])
+    extras, extra_offsets = _byte_blob(extras)
+
+    return {
+        'strings': strings,
+        'string_offsets': string_offsets,
+        'groups': np.array(groups, dtype=np.int32).reshape(-1, 2),
+        'group_entries': np.array(group_entries, dtype=np.int64),
+        'entry_section': np.array(sections, dtype=np.int8),
+        'entry_key': np.array(keys, dtype=np.int32),
+        'entry_value': np.array(values, dtype=np.int64),
+        'extras': extras,
+        'extra_offsets': extra_offsets,
+    }
+
+def publish_analysis(analysis_results, date):
+    """Write the shared analysis file of a date; call while holding the date's lock"""
+    arrays = build_arrays(analysis_results)
+
+    header, offset = {}, 0
+    for name, array in arrays.items():
+        header[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+        offset += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+    header = json.dumps(header).encode('utf-8')
+
+    # Arrays start at an aligned position after the header
+    start = -(-(16 + len(header)) // ALIGNMENT) * ALIGNMENT
+    path = shared_path(date)
+
+    with atomic_write(path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(len(header).to_bytes(8, 'little'))
+        f.write(header)
+        f.write(b'\0' * (start - 16 - len(header)))
+        for array in arrays.values():
+            data = np.ascontiguousarray(array).tobytes()
+            f.write(data)
+            f.write(b'\0' * (-len(data) % ALIGNMENT))
+
+    return path
+
+class SharedCategory(Mapping):
+    """Lazy read-only view of one region/category analysis"""
+
+    def __init__(self, shared, group):
+        self._shared = shared
+        self._group = group
+        self._data = None
+
+    def _decode(self):
+        if self._data is None:
+            self._data = self._shared.decode_group(self._group)
+        return self._data
+
+    def __getitem__(self, key):
+        return self._decode()[key]
+
+    def __iter__(self):
+        return iter(self._decode())
+
+    def __len__(self):
+        return len(self._decode())
+
+class SharedAnalysis(Mapping):
+    """Memory-mapped {region: {category: analysis}} of one date
+
+    Behaves like the dict returned by trend_store.load_analysis; category
+    analyses are decoded from the mapped arrays each time they are looked up.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._map = np.memmap(path, dtype=np.uint8, mode='r')
+
+        if bytes(self._map[:8]) != MAGIC:
+            raise ValueError(f"{path} is not a shared analysis file")
+        header_length = int.from_bytes(bytes(self._map[8:16]), 'little')
+        header = json.loads(bytes(self._map[16:16 + header_length]))
+        start = -(-(16 + header_length) // ALIGNMENT) * ALIGNMENT
+
+        self.arrays = {}
+        for name, spec in header.items():
+            dtype = np.dtype(spec['dtype'])
+            count = int(np.prod(spec['shape']))
+            offset = start + spec['offset']
+            array = self._map[offset:offset + count * dtype.itemsize].view(dtype)
+            self.arrays[name] = array.reshape(spec['shape'])
+
+        # Region/category names are tiny; everything else stays mapped
+        self._groups = {}
+        for group, (region, category) in enumerate(self.arrays['groups']):
+            self._groups.setdefault(self.string(region), {})[self.string(category)] = group
+
+    def string(self, string_id):
+        """Entry of the string table"""
+        offsets = self.arrays['string_offsets']
+        return bytes(self.arrays['strings'][offsets[string_id]:offsets[string_id + 1]]).decode('utf-8')
+
+    def decode_group(self, group):
+        """Rebuild the analysis dict of one region/category"""
+        offsets = self.arrays['extra_offsets']
+        data = json.loads(bytes(self.arrays['extras'][offsets[group]:offsets[group + 1]]))
+        present = data.pop('_sections')
+
+        start, end = self.arrays['group_entries'][group:group + 2]
+        sections = {name: {} for name in present}
+        for section_id, key, value in zip(self.arrays['entry_section'][start:end].tolist(),
+                                          self.arrays['entry_key'][start:end].tolist(),
+                                          self.arrays['entry_value'][start:end].tolist()):
+            sections[COUNT_SECTIONS[section_id]][self.string(key)] = value
+
+        # Keep the key order of the analyzer's output
+        stats = {'stats': data.pop('stats')} if 'stats' in data else {}
+        return {**stats, **{name: sections[name] for name in COUNT_SECTIONS if name in sections}, **data}
+
+    def __getitem__(self, region):
+        return {category: SharedCategory(self, group) for category, group in self._groups[region].items()}
+
+    def __iter__(self):
+        return iter(self._groups)
+
+    def __len__(self):
+        return len(self._groups)
+
+def open_shared_analysis(date):
+    """Map a date's shared analysis, publishing it from the query store if missing
+
+    Returns None when the date has no analysis results.
+    """
+    path = shared_path(date)
+    if not os.path.exists(path):
+        from trend_store import open_store, load_analysis
+
+        with partition_lock(date):
+            if not os.path.exists(path):
+                with open_store() as conn:
+                    analysis_results = load_analysis(conn, date)
+                if not analysis_results:
+                    return None
+                publish_analysis(analysis_results, date)
+
+    return SharedAnalysis(path)
+
+def _memory_usage():
+    """Resident and proportional set size of this process in KiB (Linux only)"""
+    usage = {}
+    with open('/proc/self/status', 'r') as f:
+        for line in f:
+            if line.startswith(('VmRSS:', 'RssAnon:', 'RssFile:')):
+                name, value = line.split(':')
+                usage[name] = int(value.split()[0])
+    try:
+        with open('/proc/self/smaps_rollup', 'r') as f:
+            for line in f:
+                if line.startswith('Pss:'):
+                    usage['Pss'] = int(line.split()[1])
+    except FileNotFoundError:
+        pass
+    return usage
+
+def _session(mode, dates, ready, done):
+    """One simulated dashboard session holding every date's analysis"""
+    from trend_store import open_store, load_analysis
+
+    held = []
+    if mode == 'parsed':
+        # What each session held before: its own parsed copy of every analysis
+        with open_store() as conn:
+            held = [load_analysis(conn, date) for date in dates]
+    elif mode == 'shared':
+        held = [SharedAnalysis(shared_path(date)) for date in dates]
+        # Render every category once, as sessions browsing the dashboard would
+        for analysis in held:
+            for region in analysis:
+                for category in analysis[region].values():
+                    dict(category)
+
+    ready.put(_memory_usage())
+    done.wait()
+
+def benchmark(sessions=4, mode='shared', dates=None):
+    """Average memory per session for N concurrent sessions holding all analyses
+
+    mode is 'parsed' (each session loads its own dicts), 'shared' (each
+    session maps the shared files) or 'empty' (imports only, as a baseline).
+    """
+    if dates is None:
+        from trend_store import open_store, analysis_dates
+
+        with open_store() as conn:
+            dates = analysis_dates(conn)
+    if mode == 'shared':
+        for date in dates:
+            open_shared_analysis(date)
+
+    context = multiprocessing.get_context('spawn')
+    ready, done = context.Queue(), context.Event()
+    processes = [context.Process(target=_session, args=(mode, dates, ready, done)) for _ in range(sessions)]
+    for process in processes:
+        process.start()
+
+    usages = [ready.get() for _ in processes]
+    done.set()
+    for process in processes:
+        process.join()
+
+    return {
+        'mode': mode,
+        'sessions': sessions,
+        'dates': len(dates),
+        **{f'avg_{name}_kib': sum(u.get(name, 0) for u in usages) // sessions for name in usages[0]},
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Publish or benchmark shared analysis files')
+    parser.add_argument('--publish', type=str, help='Publish the shared file of a date from the query store')
+    parser.add_argument('--sessions', type=int, default=4, help='Concurrent sessions for the benchmark')
+    args = parser.parse_args()
+
+    if args.publish:
+        shared = open_shared_analysis(args.publish)
+        print(f"Published {shared.path}" if shared else f"No analysis found for {args.publish}")
+    else:
+        baseline = benchmark(args.sessions, 'empty')
+        print(baseline)
+        for mode in ('parsed', 'shared'):
+            result = benchmark(args.sessions, mode)
+            print(result)
+            print(f"  {mode}: +{result['avg_VmRSS_kib'] - baseline['avg_VmRSS_kib']} KiB RSS, "
+                  f"+{result.get('avg_Pss_kib', 0) - baseline.get('avg_Pss_kib', 0)} KiB PSS per session over the baseline")
@@ -0,0 +1,300 @@
+# similarity_index.py
+# Local similarity search over trending titles and tags
+#
+# Videos are vectorized with hashed word, word-bigram, character-trigram and
+# tag features (no model download or network access). Vectors are stored as
+# inverted-index segments of memory-mapped .npy files (sorted feature ids,
+# posting offsets, rows and weights); each update appends a new segment and
+# segments are merged once there are too many of them.
+# Queries weight their features by inverse document frequency and score only
+# the postings of those features, then keep the top k with argpartition.
+
+import json
+import os
+import re
+import shutil
+import zlib
+
+import numpy as np
+
+from storage import DATA_DIR, atomic_write, write_json, partition_lock
+from trend_store import open_store, snapshot_dates, load_snapshot, latest_videos
+
+INDEX_DIR = os.path.join(DATA_DIR, 'similarity')
+MANIFEST_PATH = os.path.join(INDEX_DIR, 'index.json')
+
+# Size of the hashed feature space
+N_FEATURES = 2 ** 20
+
+# Segments are merged when there are more than this many
+MAX_SEGMENTS = 8
+
+# Query features found in more than this share of documents are skipped;
+# they carry almost no weight but have the longest posting lists
+MAX_DOC_FREQ = 0.05
+
+TOKEN_RE = re.compile(r'\w+')
+
+def _hash(feature):
+    """Stable feature id (Python's hash() changes between runs)"""
+    return zlib.crc32(feature.encode('utf-8')) % N_FEATURES
+
+def extract_features(title, tags=()):
+    """Hashed feature ids of a title and its tags (with repeats)"""
+    words = TOKEN_RE.findall((title or '').lower())
+
+    features = [f'w:{w}' for w in words]
+    features += [f'b:{a} {b}' for a, b in zip(words, words[1:])]
+    for w in words:
+        padded = f'#{w}#'
+        features += [f'c:{padded[i:i + 3]}' for i in range(len(padded) - 2)]
+    features += [f't:{t.lower()}' for t in (tags or [])]
+
+    return [_hash(f) for f in features]
+
+def vectorize(title, tags=()):
+    """Sparse L2-normalized vector as (feature ids, weights) with sublinear tf"""
+    ids, counts = np.unique(np.array(extract_features(title, tags), dtype=np.int64), return_counts=True)
+    weights = 1.0 + np.log(counts)
+    norm = np.linalg.norm(weights)
+    return ids, (weights / norm if norm else weights).astype(np.float32)
+
+def _load_manifest():
+    """Index manifest: segment names, indexed dates and document counts"""
+    try:
+        with open(MANIFEST_PATH, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'version': 0, 'segments': [], 'dates': [], 'documents': 0}
+
+def _save_array(path, array):
+    """Atomically write a .npy file"""
+    with atomic_write(path, 'wb') as f:
+        np.save(f, array)
+
+def _write_segment(name, video_ids, rows, features, weights):
+    """Write one inverted-index segment from (row, feature, weight) triples"""
+    path = os.path.join(INDEX_DIR, name)
+    os.makedirs(path, exist_ok=True)
+
+    # Sort postings by feature so each feature's postings are contiguous
+    order = np.argsort(features, kind='stable')
+    unique, counts = np.unique(features[order], return_counts=True)
+    offsets = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+
+    _save_array(os.path.join(path, 'features.npy'), unique.astype(np.int32))
+    _save_array(os.path.join(path, 'offsets.npy'), offsets)
+    _save_array(os.path.join(path, 'rows.npy'), rows[order].astype(np.int32))
+    _save_array(os.path.join(path, 'weights.npy'), weights[order].astype(np.float32))
+    _save_array(os.path.join(path, 'video_ids.npy'), np.array(video_ids, dtype=str))
+
+class Segment:
+    """One memory-mapped inverted-index segment"""
+
+    def __init__(self, name):
+        path = os.path.join(INDEX_DIR, name)
+        self.name = name
+        self.features = np.load(os.path.join(path, 'features.npy'), mmap_mode='r')
+        self.offsets = np.load(os.path.join(path, 'offsets.npy'), mmap_mode='r')
+        self.rows = np.load(os.path.join(path, 'rows.npy'), mmap_mode='r')
+        self.weights = np.load(os.path.join(path, 'weights.npy'), mmap_mode='r')
+        self.video_ids = np.load(os.path.join(path, 'video_ids.npy'), mmap_mode='r')
+
+    def __len__(self):
+        return len(self.video_ids)
+
+    def _positions(self, features):
+        """Position of each feature in this segment's feature list (-1 if absent)"""
+        positions = np.searchsorted(self.features, features)
+        positions = np.minimum(positions, len(self.features) - 1)
+        found = (len(self.features) > 0) & (np.asarray(self.features)[positions] == features)
+        return np.where(found, positions, -1)
+
+    def doc_freq(self, features):
+        """Number of documents in this segment containing each feature"""
+        if len(self.features) == 0:
+            return np.zeros(len(features), dtype=np.int64)
+        positions = self._positions(features)
+        valid = np.maximum(positions, 0)
+        return np.where(positions >= 0, self.offsets[valid + 1] - self.offsets[valid], 0)
+
+    def score(self, features, weights):
+        """Dot product of the query with every document of the segment"""
+        scores = np.zeros(len(self), dtype=np.float32)
+        if len(self.features) == 0:
+            return scores
+
+        for position, weight in zip(self._positions(features), weights):
+            if position < 0:
+                continue
+            start, end = self.offsets[position], self.offsets[position + 1]
+            # A document appears at most once per feature, so plain indexing is safe
+            scores[self.rows[start:end]] += weight * self.weights[start:end]
+        return scores
+
+    def triples(self):
+        """All (row, feature, weight) postings of the segment"""
+        features = np.repeat(np.asarray(self.features, dtype=np.int64), np.diff(self.offsets))
+        return np.asarray(self.rows, dtype=np.int64), features, np.asarray(self.weights)
+
+class SimilarityIndex:
+    """Read-only view of the index for querying"""
+
+    def __init__(self):
+        self.manifest = _load_manifest()
+        self.segments = [Segment(name) for name in self.manifest['segments']]
+        self.documents = sum(len(s) for s in self.segments)
+
+    def query_vector(self, title, tags=()):
+        """Query features weighted by inverse document frequency"""
+        features, weights = vectorize(title, tags)
+        doc_freq = sum((s.doc_freq(features) for s in self.segments), np.zeros(len(features), dtype=np.int64))
+        idf = np.log((1 + self.documents) / (1 + doc_freq)) + 1
+
+        # Features no document has cannot match; cap the common ones unless nothing else matches
+        present = doc_freq > 0
+        keep = present & (doc_freq <= MAX_DOC_FREQ * self.documents)
+        if not keep.any():
+            keep = present
+        features, weights, idf = features[keep], weights[keep], idf[keep]
+        return features, (weights * idf).astype(np.float32)
+
+    def search(self, title, tags=(), k=10, exclude=None):
+        """Top-k most similar indexed videos as [(video_id, score)]"""
+        features, weights = self.query_vector(title, tags)
+        if len(features) == 0:
+            return []
+
+        candidates = []
+        for segment in self.segments:
+            scores = segment.score(features, weights)
+            top = np.argpartition(-scores, min(k, len(scores) - 1))[:k + 1] if len(scores) > k + 1 else np.arange(len(scores))
+            candidates += [(str(segment.video_ids[i]), float(scores[i])) for i in top if scores[i] > 0]
+
+        candidates = [c for c in candidates if c[0] != exclude]
+        return sorted(candidates, key=lambda c: c[1], reverse=True)[:k]
+
+def _indexed_ids(manifest):
+    """Video ids already present in the index"""
+    ids = set()
+    for name in manifest['segments']:
+        ids.update(np.load(os.path.join(INDEX_DIR, name, 'video_ids.npy')).tolist())
+    return ids
+
+def _merge_segments(manifest):
+    """Merge all segments into one when there are too many"""
+    segments = [Segment(name) for name in manifest['segments']]
+    video_ids, rows, features, weights = [], [], [], []
+    base = 0
+
+    for segment in segments:
+        seg_rows, seg_features, seg_weights = segment.triples()
+        rows.append(seg_rows + base)
+        features.append(seg_features)
+        weights.append(seg_weights)
+        video_ids += segment.video_ids.tolist()
+        base += len(segment)
+
+    name = f'seg_{manifest["version"]:06d}_merged'
+    _write_segment(name, video_ids, np.concatenate(rows), np.concatenate(features), np.concatenate(weights))
+
+    old = manifest['segments']
+    manifest['segments'] = [name]
+    return old
+
+def _add_videos(manifest, videos, known=None):
+    """Append a segment for the new videos; call while holding the index lock
+
+    known is the set of indexed video ids; it is loaded when not given and
+    updated in place with the added videos.
+    """
+    if known is None:
+        known = _indexed_ids(manifest)
+
+    video_ids, rows, features, weights = [], [], [], []
+    for video in videos:
+        if video['video_id'] in known:
+            continue
+        known.add(video['video_id'])
+
+        ids, vector = vectorize(video.get('title'), video.get('tags'))
+        rows.append(np.full(len(ids), len(video_ids), dtype=np.int64))
+        features.append(ids)
+        weights.append(vector)
+        video_ids.append(video['video_id'])
+
+    removed = []
+    if video_ids:
+        manifest['version'] += 1
+        name = f'seg_{manifest["version"]:06d}'
+        _write_segment(name, video_ids, np.concatenate(rows), np.concatenate(features), np.concatenate(weights))
+        manifest['segments'].append(name)
+        manifest['documents'] += len(video_ids)
+
+        if len(manifest['segments']) > MAX_SEGMENTS:
+            removed = _merge_segments(manifest)
+
+    write_json(MANIFEST_PATH, manifest)
+
+    # Old segment files go only after the manifest stops referencing them
+    for name in removed:
+        shutil.rmtree(os.path.join(INDEX_DIR, name), ignore_errors=True)
+
+    return len(video_ids)
+
+def add_videos(videos):
+    """Index videos (dicts with video_id, title, tags) not yet in the index"""
+    with partition_lock('similarity'):
+        return _add_videos(_load_manifest(), videos)
+
+def update_index():
+    """Index the videos of every collected date not yet indexed"""
+    added = 0
+
+    with partition_lock('similarity'), open_store() as conn:
+        manifest = _load_manifest()
+        # Loaded once, so backfilling many dates does not re-read every segment per date
+        known = None
+
+        for date in sorted(set(snapshot_dates(conn)) - set(manifest['dates'])):
+            if known is None:
+                known = _indexed_ids(manifest)
+            snapshot = load_snapshot(conn, date)
+            manifest['dates'].append(date)
+            added += _add_videos(manifest, (v for region_data in snapshot.values() for vs in region_data.values() for v in vs), known)
+
+    return added
+
+def search_videos(query, k=10, index=None):
+    """Search by free text, returning result rows with video metadata"""
+    index = index or SimilarityIndex()
+    results = index.search(query, k=k)
+    return _with_metadata(results)
+
+def similar_videos(video_id, k=10, index=None):
+    """Videos most similar to an indexed or collected video"""
+    index = index or SimilarityIndex()
+    with open_store() as conn:
+        video = latest_videos(conn, [video_id]).get(video_id)
+    if video is None:
+        return []
+    return _with_metadata(index.search(video['title'], video['tags'], k=k, exclude=video_id))
+
+def _with_metadata(results):
+    """Attach title/channel/region/date from the query store to search results"""
+    with open_store() as conn:
+        metadata = latest_videos(conn, [video_id for video_id, _ in results])
+
+    rows = []
+    for video_id, score in results:
+        video = metadata.get(video_id, {})
+        rows.append({
+            'video_id': video_id,
+            'score': round(score, 4),
+            'title': video.get('title'),
+            'channel_title': video.get('channel_title'),
+            'region': video.get('region'),
+            'date': video.get('date'),
+            'view_count': video.get('view_count'),
+        })
+    return rows
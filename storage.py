@@ -0,0 +1,95 @@
+# storage.py
+# Crash-safe file writes, per-partition locks and versioned manifests
+
+import json
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+DATA_DIR = 'data'
+LOCK_DIR = os.path.join(DATA_DIR, '.locks')
+
+@contextmanager
+def atomic_write(path, mode='w'):
+    """Write to a temporary file next to path and rename it into place on success"""
+    directory = os.path.dirname(path) or '.'
+    if not os.path.exists(directory):
+        os.makedirs(directory, exist_ok=True)
+
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f'.{os.path.basename(path)}.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, mode) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, 0o644)
+        # Readers see either the old file or the complete new one
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def write_json(path, data):
+    """Atomically write data as JSON"""
+    with atomic_write(path) as f:
+        json.dump(data, f)
+
+@contextmanager
+def partition_lock(partition, shared=False):
+    """Advisory lock for one data partition (a date, or a shared file like 'features')"""
+    if not os.path.exists(LOCK_DIR):
+        os.makedirs(LOCK_DIR, exist_ok=True)
+
+    with open(os.path.join(LOCK_DIR, f'{partition}.lock'), 'a+') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        else:
+            # msvcrt has no shared locks; readers wait like writers
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+def manifest_path(date):
+    """Path of the manifest for a date partition"""
+    return os.path.join(DATA_DIR, f'manifest_{date}.json')
+
+def read_manifest(date):
+    """Current manifest of a date partition (empty if none was written)"""
+    try:
+        with open(manifest_path(date), 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'date': date, 'version': 0, 'files': {}}
+
+def record_files(date, paths):
+    """Bump the partition version and record the given files in its manifest
+
+    Call while holding partition_lock(date).
+    """
+    manifest = read_manifest(date)
+    manifest['version'] += 1
+    manifest['updated_at'] = time.time()
+
+    for path in paths:
+        manifest['files'][os.path.basename(path)] = {
+            'bytes': os.path.getsize(path),
+            'version': manifest['version'],
+        }
+
+    write_json(manifest_path(date), manifest)
+    return manifest
@@ -0,0 +1,43 @@
+# tests/test_startup.py
+# Startup budget for the command-line interface
+
+import os
+import subprocess
+import sys
+import time
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules `main.py --help` must not import
+HEAVY_MODULES = ['pandas', 'numpy', 'googleapiclient', 'requests']
+
+# Wall-time budget for `main.py --help` in seconds (about 0.1s when nothing heavy is imported)
+STARTUP_BUDGET = 0.5
+
+class StartupBudgetTest(unittest.TestCase):
+    def run_help(self):
+        start = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', 'main.py', '--help'],
+            cwd=ROOT, capture_output=True, text=True
+        )
+        return result, time.perf_counter() - start
+
+    def test_help_skips_heavy_imports(self):
+        result, _ = self.run_help()
+        self.assertEqual(result.returncode, 0, result.stderr)
+
+        # importtime lines end with "| <module>", nested imports are indented
+        imported = {line.rsplit('|', 1)[-1].strip() for line in result.stderr.splitlines() if line.startswith('import time:')}
+        for module in HEAVY_MODULES:
+            loaded = sorted(m for m in imported if m == module or m.startswith(module + '.'))
+            self.assertEqual(loaded, [], f"`main.py --help` imports {module}")
+
+    def test_help_within_budget(self):
+        # Best of three, so one slow run on a busy machine does not fail the check
+        elapsed = min(self.run_help()[1] for _ in range(3))
+        self.assertLess(elapsed, STARTUP_BUDGET, f"`main.py --help` took {elapsed:.3f}s")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,176 @@
+# tests/test_streaming.py
+# Streamed insights against a local server-sent events stub
+
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import llm_insights
+
+# Seconds between streamed deltas
+DELTA_INTERVAL = 0.2
+
+DELTAS = ['Short-form ', 'reviews ', 'are ', 'rising.']
+
+CATEGORY_DATA = {
+    'stats': {'total_videos': 2, 'avg_views': 1000, 'median_views': 900, 'avg_likes': 50, 'avg_comments': 5, 'avg_duration': 300},
+    'duration_distribution': {'Short (1-5m)': 2},
+    'title_patterns': {'has_question': 1},
+    'video_formats': {'review': 2},
+    'common_words': {'review': 2},
+    'top_tags': {'tech': 2},
+    'top_channels': {'Channel': 2},
+    'outliers': [],
+    'emerging': {'rising': [], 'falling': []},
+}
+
+ANALYSIS = {'US': {'All': CATEGORY_DATA}}
+
+class StreamStub:
+    """Chat endpoint streaming DELTAS as chunked SSE
+
+    mode 'drop' cuts the stream with a malformed event, 'close' ends it
+    cleanly before [DONE] and 'error' returns 500.
+    """
+
+    def __init__(self, mode='ok'):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers['Content-Length']))
+
+                if stub.mode == 'error':
+                    body = b'{"error": "unavailable"}'
+                    self.send_response(500)
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                    return
+
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+
+                deltas = DELTAS[:2] if stub.mode in ('drop', 'close') else DELTAS
+                for delta in deltas:
+                    event = {'choices': [{'delta': {'content': delta}}]}
+                    self.send_chunk(f'data: {json.dumps(event)}\n\n')
+                    time.sleep(DELTA_INTERVAL)
+
+                if stub.mode == 'drop':
+                    # Malformed event, as from a connection cut mid-stream
+                    self.send_chunk('data: {"choices": [\n\n')
+                elif stub.mode == 'close':
+                    # The response ends without [DONE] or a finish_reason
+                    pass
+                else:
+                    self.send_chunk('data: [DONE]\n\n')
+                self.wfile.write(b'0\r\n\r\n')
+
+            def send_chunk(self, text):
+                data = text.encode('utf-8')
+                self.wfile.write(f'{len(data):x}\r\n'.encode() + data + b'\r\n')
+                self.wfile.flush()
+
+            def log_message(self, *args):
+                pass
+
+        self.mode = mode
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}/openai'
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+class StreamInsightsTest(unittest.TestCase):
+    def setUp(self):
+        # Insights are cached under data/ relative to the working directory
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+
+        self.stub = StreamStub()
+        self.api_url = llm_insights.POLLINATIONS_API_URL
+        llm_insights.POLLINATIONS_API_URL = self.stub.url
+
+    def tearDown(self):
+        llm_insights.POLLINATIONS_API_URL = self.api_url
+        self.stub.stop()
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def stream(self, metrics):
+        """Consume stream_insights, recording when each piece arrived"""
+        start = time.perf_counter()
+        received = []
+        for text in llm_insights.stream_insights(ANALYSIS, 'US', 'All', date='2024-01-01', metrics=metrics):
+            received.append((text, time.perf_counter() - start))
+        return received
+
+    def cache_path(self):
+        return llm_insights.insights_path('US', 'All', '2024-01-01')
+
+    def test_deltas_arrive_incrementally(self):
+        metrics = {}
+        received = self.stream(metrics)
+
+        self.assertEqual([text for text, _ in received], DELTAS)
+        # The first delta is yielded before the server has sent the rest
+        self.assertLess(received[0][1], DELTA_INTERVAL)
+        self.assertGreaterEqual(received[-1][1] - received[0][1], (len(DELTAS) - 1) * DELTA_INTERVAL * 0.9)
+
+    def test_metrics(self):
+        metrics = {}
+        self.stream(metrics)
+
+        self.assertIsNotNone(metrics['time_to_first_token'])
+        self.assertLess(metrics['time_to_first_token'], DELTA_INTERVAL)
+        self.assertGreaterEqual(metrics['total_time'], len(DELTAS) * DELTA_INTERVAL * 0.9)
+
+    def test_full_stream_is_cached(self):
+        self.stream({})
+
+        with open(self.cache_path(), 'r') as f:
+            self.assertEqual(f.read(), ''.join(DELTAS))
+
+    def test_interrupted_stream_is_not_cached(self):
+        self.stub.mode = 'drop'
+        received = self.stream({})
+
+        self.assertEqual([text for text, _ in received], DELTAS[:2])
+        self.assertFalse(os.path.exists(self.cache_path()))
+
+    def test_stream_closed_before_done_is_not_cached(self):
+        self.stub.mode = 'close'
+        received = self.stream({})
+
+        self.assertEqual([text for text, _ in received], DELTAS[:2])
+        self.assertFalse(os.path.exists(self.cache_path()))
+
+    def test_failed_request_falls_back_without_caching(self):
+        self.stub.mode = 'error'
+        metrics = {}
+        received = self.stream(metrics)
+
+        self.assertEqual(len(received), 1)
+        self.assertIn('YouTube Trend Analysis', received[0][0])
+        self.assertIsNone(metrics['time_to_first_token'])
+        self.assertFalse(os.path.exists(self.cache_path()))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,44 +5,44 @@ import pandas as pd
 import numpy as np
 import re
 from collections import Counter
+import io
 import json
 from datetime import datetime
 import os
 from config import CATEGORIES, REGIONS
+from video_scoring import trending_frame, score_videos, find_outliers
+from trend_emergence import update_emergence
+from trend_store import open_store, load_snapshot, ingest_snapshot, ingest_analysis, channel_video_views
+from channel_index import WINDOWS as CHANNEL_WINDOWS, latest_indexed_date, window_start, top_channels as channel_rollup, top_channels_between, channel_titles
+from shared_results import publish_analysis
+from retention import read_archived_file
+from storage import write_json, atomic_write, partition_lock, record_files
+from feature_extractor import (FeatureTable, TITLE_PATTERNS, VIDEO_FORMATS, FORMAT_NAMES,
+                               DURATION_BINS, DURATION_LABELS, STOP_WORDS)
+
+# How many entries of each ranking the dashboard shows
+VIEW_LIMITS = {'words': 15, 'tags': 15, 'channels': 10}
+
+# Video formats, in the order used for the region comparison matrices
+FORMAT_LABELS = FORMAT_NAMES
+
+# Number of tags kept as columns of the region x tag matrix
+COMPARISON_TAG_LIMIT = 30
 
 def extract_title_patterns(titles):
     """Extract common patterns from video titles"""
     
-    patterns = {
-        'question': sum(1 for t in titles if re.search(r'\?|\bwhy\b|\bhow\b|\bwhat\b', t, re.I)),
-        'all_caps': sum(1 for t in titles if t.isupper()),
-        'emoji': sum(1 for t in titles if any(c for c in t if ord(c) > 0x1F000)),
-        'number_in_title': sum(1 for t in titles if re.search(r'\d+', t)),
-        'exclamation': sum(1 for t in titles if '!' in t),
-        'parentheses': sum(1 for t in titles if '(' in t and ')' in t),
-        'brackets': sum(1 for t in titles if '[' in t and ']' in t),
-    }
+    patterns = {name: sum(1 for t in titles if predicate(t)) for name, predicate in TITLE_PATTERNS}
     
     # Video formats
-    formats = {
-        'listicle': sum(1 for t in titles if re.search(r'^\d+\s|\s\d+\s|top\s\d+', t, re.I)),
-        'reaction': sum(1 for t in titles if re.search(r'reacting|reaction', t, re.I)),
-        'tutorial': sum(1 for t in titles if re.search(r'how to|tutorial|guide', t, re.I)),
-        'review': sum(1 for t in titles if re.search(r'review|unboxing', t, re.I)),
-        'challenge': sum(1 for t in titles if re.search(r'challenge', t, re.I)),
-        'day_in_life': sum(1 for t in titles if re.search(r'day in|day of|day in the life', t, re.I)),
-        'asmr': sum(1 for t in titles if re.search(r'asmr', t, re.I)),
-        'shorts': sum(1 for t in titles if re.search(r'#shorts|shorts', t, re.I)),
-        'live': sum(1 for t in titles if re.search(r'live|stream', t, re.I)),
-        'podcast': sum(1 for t in titles if re.search(r'podcast|episode', t, re.I)),
-    }
+    formats = {name: sum(1 for t in titles if predicate(t)) for name, predicate in VIDEO_FORMATS}
     
     return {"patterns": patterns, "formats": formats}
 
 def extract_common_words(titles, min_length=4, stop_words=None):
     """Extract common words from titles after removing stop words"""
     if stop_words is None:
-        stop_words = {'the', 'a', 'an', 'and', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by', 'as', 'is', 'are', 'was', 'were', 'be', 'this', 'that', 'my', 'your', 'our', 'their'}
+        stop_words = STOP_WORDS
     
     # Combine titles and lowercase
     text = ' '.join(titles).lower()
@@ -58,8 +58,24 @@ def extract_common_words(titles, min_length=4, stop_words=None):
     
     return dict(word_counts.most_common(30))
 
-def analyze_trending_videos(df):
-    """Analyze trending videos to extract insights"""
+def count_channels(df, limit=None):
+    """Videos per channel, counted by channel_id and labelled with the latest title"""
+    channel_ids = df['channel_id'].value_counts()
+    if limit is not None:
+        channel_ids = channel_ids.head(limit)
+    titles = df.drop_duplicates('channel_id', keep='last').set_index('channel_id')['channel_title']
+    duplicated = titles[titles.duplicated(keep=False)].index
+    return {
+        f'{titles[cid]} ({cid})' if cid in duplicated else titles[cid]: int(count)
+        for cid, count in channel_ids.items()
+    }
+
+def analyze_trending_videos(df, features=None):
+    """Analyze trending videos to extract insights
+    
+    When a FeatureTable holding these videos is given, patterns, words,
+    tags and durations are aggregated from it instead of the raw strings.
+    """
     
     if df.empty:
         return {"error": "No data to analyze"}
@@ -68,31 +84,37 @@ def analyze_trending_videos(df):
     stats = {
         'total_videos': len(df),
         'avg_views': int(df['view_count'].mean()),
+        'median_views': int(df['view_count'].median()),
         'avg_likes': int(df['like_count'].mean()),
         'avg_comments': int(df['comment_count'].mean()),
         'avg_duration': int(df['duration_seconds'].mean()),
     }
     
-    # Duration distribution
-    duration_bins = [0, 60, 300, 600, 1200, 1800, 3600, float('inf')]
-    duration_labels = ['<1 min', '1-5 min', '5-10 min', '10-20 min', '20-30 min', '30-60 min', '>60 min']
-    
-    duration_counts = pd.cut(df['duration_seconds'], bins=duration_bins, labels=duration_labels)
-    duration_distribution = duration_counts.value_counts().to_dict()
-    
-    # Extract title patterns
-    titles = df['title'].tolist()
-    title_analysis = extract_title_patterns(titles)
-    
-    # Extract common words
-    common_words = extract_common_words(titles)
-    
-    # Extract common tags
-    all_tags = [tag for tags_list in df['tags'] for tag in tags_list if tags_list]
-    tag_counts = Counter(all_tags).most_common(20)
+    if features is not None:
+        # Pure integer aggregation over the precomputed feature table
+        rows = features.rows_for(df['video_id'])
+        duration_distribution = features.duration_counts(rows)
+        title_analysis = features.flag_counts(rows)
+        common_words = features.word_counts(rows)
+        tag_counts = features.tag_counts(rows)
+    else:
+        # Duration distribution
+        duration_counts = pd.cut(df['duration_seconds'], bins=DURATION_BINS, labels=DURATION_LABELS)
+        duration_distribution = duration_counts.value_counts().to_dict()
+        
+        # Extract title patterns
+        titles = df['title'].tolist()
+        title_analysis = extract_title_patterns(titles)
+        
+        # Extract common words
+        common_words = extract_common_words(titles)
+        
+        # Extract common tags
+        all_tags = [tag for tags_list in df['tags'] for tag in tags_list if tags_list]
+        tag_counts = dict(Counter(all_tags).most_common(20))
     
     # Channel analysis
-    channel_counts = df['channel_title'].value_counts().head(10).to_dict()
+    channel_counts = count_channels(df, limit=10)
     
     return {
         'stats': stats,
@@ -100,10 +122,187 @@ def analyze_trending_videos(df):
         'title_patterns': title_analysis['patterns'],
         'video_formats': title_analysis['formats'],
         'common_words': common_words,
-        'top_tags': dict(tag_counts),
+        'top_tags': tag_counts,
         'top_channels': channel_counts
     }
 
+def full_group_counts(df, features):
+    """Untruncated per-group counts (the analysis only keeps the top items)"""
+    rows = features.rows_for(df['video_id'])
+    return {
+        'words': features.word_counts(rows, limit=None),
+        'tags': features.tag_counts(rows, limit=None),
+        'formats': features.flag_counts(rows)['formats'],
+        # Keyed by channel_id, so a renamed channel stays the same item
+        'channels': {cid: int(count) for cid, count in df['channel_id'].value_counts().items()},
+    }
+
+def _channel_changes(emergence):
+    """Rising/falling channel entries of each region/category group"""
+    for region_emergence in emergence.values():
+        for group in region_emergence.values():
+            yield [c for direction in group.values() for c in direction if c['dimension'] == 'channels']
+
+def label_channel_changes(emergence, titles):
+    """Replace the channel_ids of emerging channels with their titles
+
+    Titles shared by several channels of a group get the id appended; the
+    id is kept in each change as channel_id.
+    """
+    for changes in _channel_changes(emergence):
+        names = Counter(titles.get(c['item']) or c['item'] for c in changes)
+        for change in changes:
+            channel_id = change['item']
+            title = titles.get(channel_id) or channel_id
+            change['channel_id'] = channel_id
+            change['item'] = f'{title} ({channel_id})' if names[title] > 1 else title
+    return emergence
+
+def _ranked(counts, limit=None):
+    """Sort a {label: count} dict by count and return parallel label/count lists"""
+    items = sorted(counts.items(), key=lambda x: x[1], reverse=True)
+    if limit is not None:
+        items = items[:limit]
+    return {'labels': [k for k, _ in items], 'counts': [int(v) for _, v in items]}
+
+def build_category_view(category_analysis):
+    """Build the dashboard view model for one region/category analysis"""
+    durations = category_analysis['duration_distribution']
+
+    return {
+        'formats': _ranked(category_analysis['video_formats']),
+        'duration': {
+            'labels': DURATION_LABELS,
+            'counts': [int(durations.get(label, 0)) for label in DURATION_LABELS],
+        },
+        'words': _ranked(category_analysis['common_words'], VIEW_LIMITS['words']),
+        'tags': _ranked(category_analysis['top_tags'], VIEW_LIMITS['tags']),
+        'channels': _ranked(category_analysis['top_channels'], VIEW_LIMITS['channels']),
+    }
+
+def _cosine_similarity(matrix):
+    """Pairwise cosine similarity between the rows of a matrix"""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    normalized = matrix / np.where(norms == 0, 1, norms)
+    return normalized @ normalized.T
+
+def build_region_matrices(analysis_results, tag_counts=None, tag_limit=COMPARISON_TAG_LIMIT):
+    """Build dense region x feature matrices for every category
+    
+    tag_counts holds the full {region: {category: {tag: count}}} of the
+    snapshot; without it the truncated top_tags of the analysis are used.
+    """
+    if tag_counts is None:
+        tag_counts = {r: {c: a['top_tags'] for c, a in region_data.items()} for r, region_data in analysis_results.items()}
+    
+    categories = sorted({c for region_data in analysis_results.values() for c in region_data})
+    
+    matrices = {}
+    
+    for category in categories:
+        regions = [r for r in analysis_results if category in analysis_results[r]]
+        data = [analysis_results[r][category] for r in regions]
+        
+        totals = np.array([d['stats']['total_videos'] for d in data], dtype=np.float64)
+        formats = np.array([[d['video_formats'].get(f, 0) for f in FORMAT_LABELS] for d in data], dtype=np.int32)
+        duration = np.array([[d['duration_distribution'].get(b, 0) for b in DURATION_LABELS] for d in data], dtype=np.int32)
+        
+        # Tag columns are the most frequent tags across all regions of the category
+        region_tags = [tag_counts.get(r, {}).get(category, {}) for r in regions]
+        tag_totals = Counter()
+        for counts in region_tags:
+            tag_totals.update(counts)
+        tag_labels = [t for t, _ in tag_totals.most_common(tag_limit)]
+        tags = np.array([[counts.get(t, 0) for t in tag_labels] for counts in region_tags], dtype=np.int32).reshape(len(data), len(tag_labels))
+        
+        # Regions are compared on the share of videos per feature, not raw counts
+        scale = np.where(totals == 0, 1, totals)[:, None]
+        features = np.hstack([formats / scale, duration / scale, tags / scale])
+        
+        matrices[category] = {
+            'regions': np.array(regions),
+            'totals': totals.astype(np.int32),
+            'formats': formats,
+            'duration': duration,
+            'tag_labels': np.array(tag_labels, dtype=str),
+            'tags': tags,
+            'similarity': _cosine_similarity(features),
+        }
+    
+    return matrices
+
+def save_region_matrices(matrices, date):
+    """Save region comparison matrices to data/comparison_{date}.npz"""
+    arrays = {
+        'categories': np.array(list(matrices.keys())),
+        'format_labels': np.array(FORMAT_LABELS),
+        'duration_labels': np.array(DURATION_LABELS),
+    }
+    for i, category_matrices in enumerate(matrices.values()):
+        for name, array in category_matrices.items():
+            arrays[f'{name}_{i}'] = array
+    
+    with atomic_write(f'data/comparison_{date}.npz', 'wb') as f:
+        np.savez_compressed(f, **arrays)
+
+def load_region_matrices(date):
+    """Load region comparison matrices saved for a date (from its retention archive once compacted)"""
+    source = f'data/comparison_{date}.npz'
+    if not os.path.exists(source):
+        with open_store() as conn:
+            archived = read_archived_file(conn, date, f'comparison_{date}.npz')
+        if archived is None:
+            raise FileNotFoundError(source)
+        source = io.BytesIO(archived)
+    
+    with np.load(source) as archive:
+        matrices = {}
+        for i, category in enumerate(archive['categories'].tolist()):
+            matrices[category] = {
+                name: archive[f'{name}_{i}']
+                for name in ('regions', 'totals', 'formats', 'duration', 'tag_labels', 'tags', 'similarity')
+            }
+            matrices[category]['format_labels'] = archive['format_labels']
+            matrices[category]['duration_labels'] = archive['duration_labels']
+    return matrices
+
+def load_trending_data(date):
+    """Load a collection snapshot from the store, falling back to the JSON file or its archive"""
+    with open_store() as conn:
+        all_data = load_snapshot(conn, date)
+        
+        if not all_data:
+            # A store rebuilt after retention only has the snapshot in the archive
+            archived = read_archived_file(conn, date, f'all_trending_{date}.json')
+            if archived is not None:
+                return json.loads(archived)
+            
+            with open(f'data/all_trending_{date}.json', 'r') as f:
+                all_data = json.load(f)
+            ingest_snapshot(conn, all_data, date)
+    
+    return all_data
+
+def query_top_channels(category='All', region=None, days=30, end_date=None, limit=10):
+    """Top channels over a window of days (or 'all') ending at end_date
+
+    Windows ending at the latest collection come from the precomputed
+    rankings; other windows are summed from the daily channel rollups.
+    Either way appearances, views, engagement_rate and regions cover the
+    window, and the all_time_* columns the channel's whole history.
+    """
+    with open_store() as conn:
+        latest = latest_indexed_date(conn)
+        if latest is None:
+            return []
+        if str(days) in CHANNEL_WINDOWS and end_date in (None, latest):
+            return channel_rollup(conn, window=days, region=region, category=category, limit=limit)
+        
+        end_date = end_date or latest
+        # days='all' leaves the start open: everything up to end_date
+        return top_channels_between(conn, window_start(end_date, days), end_date,
+                                    region=region, category=category, limit=limit)
+
 def analyze_all_trending_data(date=None):
     """Analyze all trending data for a specific date"""
     
@@ -112,10 +311,26 @@ def analyze_all_trending_data(date=None):
     
     try:
         # Load combined data
-        with open(f'data/all_trending_{date}.json', 'r') as f:
-            all_data = json.load(f)
+        all_data = load_trending_data(date)
         
         analysis_results = {}
+        full_counts = {}
+        
+        # Features are extracted once per video and reused on later dates
+        with partition_lock('features'):
+            features = FeatureTable.load()
+            if features.update(v for region_data in all_data.values() for videos in region_data.values() for v in videos):
+                features.save()
+        
+        # Engagement and outlier scoring over the whole snapshot, with each
+        # channel's earlier trending videos as its baseline
+        snapshot = trending_frame(all_data, date)
+        with open_store() as conn:
+            history = pd.DataFrame(
+                channel_video_views(conn, snapshot['channel_id'].unique() if not snapshot.empty else [], before=date),
+                columns=['channel_id', 'video_id', 'max_views']
+            )
+        outliers = find_outliers(score_videos(snapshot, history))
         
         for region, region_data in all_data.items():
             region_analysis = {}
@@ -123,13 +338,43 @@ def analyze_all_trending_data(date=None):
             for category, videos in region_data.items():
                 df = pd.DataFrame(videos)
                 if not df.empty:
-                    region_analysis[category] = analyze_trending_videos(df)
+                    category_analysis = analyze_trending_videos(df, features)
+                    category_analysis['view'] = build_category_view(category_analysis)
+                    category_analysis['outliers'] = outliers.get(region, {}).get(category, [])
+                    region_analysis[category] = category_analysis
+                    full_counts.setdefault(region, {})[category] = full_group_counts(df, features)
             
             analysis_results[region] = region_analysis
         
+        # Rising/falling items compared with the previous snapshots
+        emergence = update_emergence(analysis_results, date, full_counts)
+        
+        # Channels that fell out of the snapshot keep their last known title
+        titles = {} if snapshot.empty else snapshot.drop_duplicates('channel_id', keep='last').set_index('channel_id')['channel_title'].to_dict()
+        missing = {c['item'] for changes in _channel_changes(emergence) for c in changes} - set(titles)
+        if missing:
+            with open_store() as conn:
+                titles.update(channel_titles(conn, missing))
+        label_channel_changes(emergence, titles)
+        for region, region_analysis in analysis_results.items():
+            for category, category_analysis in region_analysis.items():
+                category_analysis['emerging'] = emergence.get(region, {}).get(category, {'rising': [], 'falling': []})
+        
         # Save analysis results
-        with open(f'data/analysis_{date}.json', 'w') as f:
-            json.dump(analysis_results, f)
+        with partition_lock(date):
+            write_json(f'data/analysis_{date}.json', analysis_results)
+            
+            # Precompute the cross-region comparison once per date
+            tag_counts = {r: {c: counts['tags'] for c, counts in region_counts.items()} for r, region_counts in full_counts.items()}
+            save_region_matrices(build_region_matrices(analysis_results, tag_counts), date)
+            
+            # Memory-mappable copy shared by all dashboard sessions
+            shared_file = publish_analysis(analysis_results, date)
+            
+            record_files(date, [f'data/analysis_{date}.json', f'data/comparison_{date}.npz', shared_file])
+            
+            with open_store() as conn:
+                ingest_analysis(conn, analysis_results, date)
         
         return analysis_results
     
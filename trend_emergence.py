@@ -0,0 +1,138 @@
+# trend_emergence.py
+# Detect rising and falling words, tags, formats and channels across snapshots
+#
+# For every region/category the state keeps an exponentially weighted moving
+# average (EWMA) and variance of each item's count. Each new snapshot is
+# compared against that expectation and then folded into it, so only the
+# state - not the history - is read on each run.
+
+import json
+import math
+import os
+
+from storage import DATA_DIR, write_json, partition_lock
+
+STATE_PATH = os.path.join(DATA_DIR, 'emergence_state.json')
+
+# Analysis sections tracked for emergence when full counts are not given
+# (words, tags and channels are truncated to the top items there)
+DIMENSIONS = {
+    'words': 'common_words',
+    'tags': 'top_tags',
+    'formats': 'video_formats',
+    'channels': 'top_channels',
+}
+
+# EWMA smoothing factor (weight of the newest snapshot)
+ALPHA = 0.3
+
+# Added to the expected count so growth from tiny baselines is not explosive
+SMOOTHING = 1.0
+
+# Minimum variance, so a perfectly stable history does not make every change significant
+MIN_VARIANCE = 1.0
+
+# Thresholds for an item to be reported as rising or falling
+GROWTH_THRESHOLD = 0.5
+Z_THRESHOLD = 2.0
+MIN_COUNT = 2
+
+# Items reported per direction
+TOP_N = 10
+
+def load_state(path=STATE_PATH):
+    """Load the EWMA state (empty if nothing has been processed yet)"""
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'last_date': None, 'series': {}, 'previous_series': {}}
+
+def _score_group(series, current):
+    """Compare one region/category snapshot to its EWMA state and update the state
+
+    series: {dimension: {item: [ewma, variance]}}
+    current: {dimension: {item: count}}
+    """
+    changes = []
+    is_new = not series
+
+    for dimension in DIMENSIONS:
+        state = series.setdefault(dimension, {})
+        counts = current.get(dimension, {})
+
+        for item in set(state) | set(counts):
+            count = float(counts.get(item, 0))
+            ewma, variance = state.get(item, (0.0, 0.0))
+            delta = count - ewma
+
+            if not is_new:
+                growth = delta / (ewma + SMOOTHING)
+                z = delta / math.sqrt(variance + MIN_VARIANCE)
+                changes.append({
+                    'dimension': dimension,
+                    'item': item,
+                    'count': int(count),
+                    'expected': round(ewma, 2),
+                    'growth': round(growth, 3),
+                    'z': round(z, 2),
+                })
+
+            if is_new:
+                # The first snapshot only seeds the baseline
+                ewma, variance = count, 0.0
+            else:
+                ewma += ALPHA * delta
+                variance = (1 - ALPHA) * (variance + ALPHA * delta * delta)
+
+            # Forget items that have faded out completely
+            if count == 0 and ewma < 0.05:
+                state.pop(item, None)
+            else:
+                state[item] = [ewma, variance]
+
+    rising = [c for c in changes if c['growth'] >= GROWTH_THRESHOLD and c['z'] >= Z_THRESHOLD and c['count'] >= MIN_COUNT]
+    falling = [c for c in changes if c['growth'] <= -GROWTH_THRESHOLD and c['z'] <= -Z_THRESHOLD and c['expected'] >= MIN_COUNT]
+
+    return {
+        'rising': sorted(rising, key=lambda c: (c['z'], c['growth']), reverse=True)[:TOP_N],
+        'falling': sorted(falling, key=lambda c: (c['z'], c['growth']))[:TOP_N],
+    }
+
+def update_emergence(analysis_results, date, counts=None, path=STATE_PATH):
+    """Fold one snapshot's analysis into the state and return {region: {category: emergence}}
+
+    counts holds the untruncated {region: {category: {dimension: {item: count}}}}
+    of the snapshot (channels keyed by channel_id, so a rename is not a change).
+    Without it the analysis's top-item sections are used, where an item
+    dropping just below the cutoff looks like it fell to zero.
+    Snapshots must arrive in date order. Re-running the latest date replays it
+    against the state from before its first run; older dates are skipped.
+    """
+    with partition_lock('emergence'):
+        state = load_state(path)
+
+        if state['last_date'] is not None and date < state['last_date']:
+            print(f"Skipping emergence detection for {date}: state is already at {state['last_date']}")
+            return {}
+
+        if date == state['last_date']:
+            series = json.loads(json.dumps(state['previous_series']))
+        else:
+            series = state['series']
+            state['previous_series'] = json.loads(json.dumps(series))
+
+        emergence = {}
+        for region, region_analysis in analysis_results.items():
+            for category, category_analysis in region_analysis.items():
+                current = (counts or {}).get(region, {}).get(category)
+                if current is None:
+                    current = {dim: category_analysis.get(key, {}) for dim, key in DIMENSIONS.items()}
+                group = series.setdefault(region, {}).setdefault(category, {})
+                emergence.setdefault(region, {})[category] = _score_group(group, current)
+
+        state['series'] = series
+        state['last_date'] = date
+        write_json(path, state)
+
+    return emergence
@@ -0,0 +1,267 @@
+# trend_store.py
+# Local SQLite query layer over collected snapshots and analysis results
+
+import glob
+import json
+import os
+import sqlite3
+import time
+from contextlib import closing
+
+# Database file (no server needed)
+DB_PATH = 'data/trends.db'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS videos (
+    date TEXT NOT NULL,
+    region TEXT NOT NULL,
+    category TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    video_id TEXT NOT NULL,
+    channel_id TEXT,
+    channel_title TEXT,
+    title TEXT,
+    view_count INTEGER,
+    like_count INTEGER,
+    comment_count INTEGER,
+    duration_seconds INTEGER,
+    record TEXT NOT NULL,
+    PRIMARY KEY (date, region, category, video_id)
+);
+CREATE INDEX IF NOT EXISTS idx_videos_date ON videos (date);
+CREATE INDEX IF NOT EXISTS idx_videos_region_category_date ON videos (region, category, date);
+CREATE INDEX IF NOT EXISTS idx_videos_channel ON videos (channel_id, date);
+CREATE INDEX IF NOT EXISTS idx_videos_video ON videos (video_id);
+
+CREATE TABLE IF NOT EXISTS analysis (
+    date TEXT NOT NULL,
+    region TEXT NOT NULL,
+    category TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (date, region, category)
+);
+CREATE INDEX IF NOT EXISTS idx_analysis_region_category ON analysis (region, category, date);
+
+CREATE TABLE IF NOT EXISTS catalog (
+    date TEXT PRIMARY KEY,
+    tier TEXT NOT NULL DEFAULT 'raw',
+    location TEXT,
+    has_analysis INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL
+);
+"""
+
+# Record fields no query or analysis reads, dropped once a date is archived
+PRUNED_FIELDS = ['description', 'thumbnail_url']
+
+def get_connection(db_path=DB_PATH):
+    """Open the store, creating it (and importing existing JSON files) if needed"""
+    is_new = not os.path.exists(db_path)
+
+    directory = os.path.dirname(db_path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.executescript(SCHEMA)
+
+    if is_new:
+        import_json_files(conn, directory or '.')
+    elif conn.execute('SELECT COUNT(*) FROM catalog').fetchone()[0] == 0:
+        _backfill_catalog(conn)
+
+    return conn
+
+def _backfill_catalog(conn):
+    """Fill the catalog of a store created before it existed"""
+    now = time.time()
+    with conn:
+        conn.execute("""
+            INSERT OR IGNORE INTO catalog (date, has_analysis, updated_at)
+            SELECT date, 0, ? FROM (SELECT DISTINCT date FROM videos)
+        """, (now,))
+        conn.execute("""
+            INSERT INTO catalog (date, has_analysis, updated_at)
+            SELECT date, 1, ? FROM (SELECT DISTINCT date FROM analysis) WHERE 1
+            ON CONFLICT (date) DO UPDATE SET has_analysis = 1
+        """, (now,))
+
+def _register_date(conn, date, has_analysis=False):
+    """Add a date to the catalog, or mark that it now has analysis results"""
+    conn.execute("""
+        INSERT INTO catalog (date, has_analysis, updated_at) VALUES (?, ?, ?)
+        ON CONFLICT (date) DO UPDATE SET
+            has_analysis = MAX(has_analysis, excluded.has_analysis),
+            updated_at = excluded.updated_at
+    """, (date, int(has_analysis), time.time()))
+
+def _video_row(date, region, category, position, video):
+    """Row tuple for the videos table"""
+    return (
+        date, region, category, position, video['video_id'],
+        video.get('channel_id'), video.get('channel_title'), video.get('title'),
+        int(video.get('view_count') or 0), int(video.get('like_count') or 0),
+        int(video.get('comment_count') or 0), int(video.get('duration_seconds') or 0),
+        json.dumps(video, default=str),
+    )
+
+def ingest_snapshot(conn, all_trends, date):
+    """Store a {region: {category: [videos]}} collection snapshot"""
+    rows = [
+        _video_row(date, region, category, position, video)
+        for region, region_data in all_trends.items()
+        for category, videos in region_data.items()
+        for position, video in enumerate(videos)
+    ]
+
+    with conn:
+        conn.execute('DELETE FROM videos WHERE date = ?', (date,))
+        conn.executemany('INSERT OR REPLACE INTO videos VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+        _register_date(conn, date)
+
+    # Keep the channel rollups in step with the stored snapshots
+    from channel_index import index_snapshot
+    index_snapshot(conn, all_trends, date)
+
+def ingest_analysis(conn, analysis_results, date):
+    """Store the analysis results for a date"""
+    now = time.time()
+    rows = [
+        (date, region, category, json.dumps(category_analysis), now)
+        for region, region_analysis in analysis_results.items()
+        for category, category_analysis in region_analysis.items()
+    ]
+
+    with conn:
+        conn.execute('DELETE FROM analysis WHERE date = ?', (date,))
+        conn.executemany('INSERT INTO analysis VALUES (?, ?, ?, ?, ?)', rows)
+        _register_date(conn, date, has_analysis=True)
+
+def import_json_files(conn, data_dir='data'):
+    """Import existing all_trending_*.json and analysis_*.json files"""
+    for path in sorted(glob.glob(os.path.join(data_dir, 'all_trending_*.json'))):
+        date = os.path.basename(path)[len('all_trending_'):-len('.json')]
+        with open(path, 'r') as f:
+            ingest_snapshot(conn, json.load(f), date)
+
+    for path in sorted(glob.glob(os.path.join(data_dir, 'analysis_*.json'))):
+        date = os.path.basename(path)[len('analysis_'):-len('.json')]
+        with open(path, 'r') as f:
+            ingest_analysis(conn, json.load(f), date)
+
+def snapshot_dates(conn):
+    """Dates with collected snapshots, newest first"""
+    return [row[0] for row in conn.execute('SELECT DISTINCT date FROM videos ORDER BY date DESC')]
+
+def analysis_dates(conn):
+    """Dates with analysis results, newest first (read from the catalog)"""
+    return [row[0] for row in conn.execute('SELECT date FROM catalog WHERE has_analysis ORDER BY date DESC')]
+
+def catalog_entries(conn):
+    """All catalogued dates with their retention tier and archive location"""
+    return [dict(row) for row in conn.execute('SELECT * FROM catalog ORDER BY date')]
+
+def catalog_entry(conn, date):
+    """Catalog entry of one date (None if unknown)"""
+    row = conn.execute('SELECT * FROM catalog WHERE date = ?', (date,)).fetchone()
+    return dict(row) if row else None
+
+def set_tier(conn, date, tier, location=None):
+    """Record where a date's files live after retention moved them"""
+    with conn:
+        conn.execute(
+            'UPDATE catalog SET tier = ?, location = ?, updated_at = ? WHERE date = ?',
+            (tier, location, time.time(), date)
+        )
+
+def prune_snapshot(conn, date):
+    """Strip a date's video records to what queries use, once retention has archived its snapshot
+
+    The rows stay (channel rollups, similarity search and re-analysis read
+    them); only the bulky fields nothing reads are dropped from the records.
+    """
+    fields = ', '.join(f"'$.{field}'" for field in PRUNED_FIELDS)
+    with conn:
+        conn.execute(f'UPDATE videos SET record = json_remove(record, {fields}) WHERE date = ?', (date,))
+
+def analysis_version(conn, date):
+    """Timestamp of the last analysis write for a date (None if missing)"""
+    return conn.execute('SELECT MAX(updated_at) FROM analysis WHERE date = ?', (date,)).fetchone()[0]
+
+def load_snapshot(conn, date, region=None, category=None):
+    """Load a collection snapshot as {region: {category: [videos]}}"""
+    query = 'SELECT region, category, record FROM videos WHERE date = ?'
+    params = [date]
+    if region is not None:
+        query += ' AND region = ?'
+        params.append(region)
+    if category is not None:
+        query += ' AND category = ?'
+        params.append(category)
+    query += ' ORDER BY rowid'
+
+    snapshot = {}
+    for row in conn.execute(query, params):
+        snapshot.setdefault(row['region'], {}).setdefault(row['category'], []).append(json.loads(row['record']))
+    return snapshot
+
+def latest_videos(conn, video_ids):
+    """Most recent collected record of each video as {video_id: record}"""
+    videos = {}
+    video_ids = list(video_ids)
+
+    # Stay below SQLite's limit on query parameters
+    for i in range(0, len(video_ids), 500):
+        chunk = video_ids[i:i + 500]
+        query = f"""
+            SELECT video_id, date, region, category, record FROM videos
+            WHERE video_id IN ({','.join('?' * len(chunk))})
+            ORDER BY date
+        """
+        for row in conn.execute(query, chunk):
+            record = json.loads(row['record'])
+            record.update(date=row['date'], region=row['region'], category=row['category'])
+            videos[row['video_id']] = record
+
+    return videos
+
+def channel_video_views(conn, channel_ids, before):
+    """Peak views of every video the given channels trended with before a date, as (channel_id, video_id, views)"""
+    channel_ids = list(channel_ids)
+    rows = []
+
+    # Stay below SQLite's limit on query parameters
+    for i in range(0, len(channel_ids), 500):
+        chunk = channel_ids[i:i + 500]
+        query = f"""
+            SELECT channel_id, video_id, MAX(view_count) FROM videos
+            WHERE channel_id IN ({','.join('?' * len(chunk))}) AND date < ?
+            GROUP BY channel_id, video_id
+        """
+        rows += [tuple(row) for row in conn.execute(query, chunk + [before])]
+
+    return rows
+
+def load_analysis(conn, date, region=None, category=None):
+    """Load analysis results as {region: {category: analysis}}"""
+    query = 'SELECT region, category, payload FROM analysis WHERE date = ?'
+    params = [date]
+    if region is not None:
+        query += ' AND region = ?'
+        params.append(region)
+    if category is not None:
+        query += ' AND category = ?'
+        params.append(category)
+    query += ' ORDER BY rowid'
+
+    results = {}
+    for row in conn.execute(query, params):
+        results.setdefault(row['region'], {})[row['category']] = json.loads(row['payload'])
+    return results
+
+def open_store(db_path=DB_PATH):
+    """Context manager that opens the store and closes it afterwards"""
+    return closing(get_connection(db_path))
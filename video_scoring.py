@@ -0,0 +1,154 @@
+# video_scoring.py
+# Vectorized engagement and outlier scoring for trending snapshots
+
+import numpy as np
+import pandas as pd
+
+# Scale factor that makes the MAD comparable to a standard deviation
+MAD_SCALE = 0.6745
+
+# Robust z-score above which a video counts as an outlier (Iglewicz & Hoaglin)
+OUTLIER_Z = 3.5
+
+# A video "breaks out" when it has this many times its channel's median views
+CHANNEL_BREAKOUT_RATIO = 3.0
+
+# Minimum number of other trending videos needed to know a channel's usual performance
+CHANNEL_MIN_VIDEOS = 3
+
+def trending_frame(all_data, date=None):
+    """Flatten {region: {category: [videos]}} into one DataFrame"""
+    frames = []
+
+    for region, region_data in all_data.items():
+        for category, videos in region_data.items():
+            if not videos:
+                continue
+            df = pd.DataFrame(videos)
+            df['region'] = region
+            df['category'] = category
+            frames.append(df)
+
+    if not frames:
+        return pd.DataFrame()
+
+    df = pd.concat(frames, ignore_index=True)
+    if date is not None:
+        df['date'] = date
+    return df
+
+def _group_keys(df):
+    """Columns that identify one snapshot group (date/region/category)"""
+    return [c for c in ('date', 'region', 'category') if c in df.columns]
+
+def robust_zscore(values, groups):
+    """Median/MAD z-score of a Series computed within each group"""
+    grouped = values.groupby(groups)
+    median = grouped.transform('median')
+    deviation = (values - median).abs()
+    mad = deviation.groupby(groups).transform('median')
+
+    z = MAD_SCALE * (values - median) / mad.where(mad > 0)
+    return z.fillna(0.0)
+
+def channel_baselines(df, history):
+    """Median peak views and count of each row's other videos from the same channel
+
+    history has one row per (channel_id, video_id) with its peak views in max_views.
+    """
+    pairs = df[['channel_id', 'video_id']].reset_index().merge(history, on='channel_id', suffixes=('', '_other'))
+    pairs = pairs[pairs['video_id_other'] != pairs['video_id']]
+    grouped = pairs.groupby('index')['max_views']
+
+    median = grouped.median().reindex(df.index)
+    count = grouped.size().reindex(df.index, fill_value=0)
+    return median, count
+
+def score_videos(df, history=None):
+    """Add engagement rates, robust z-scores, percentile ranks and outlier flags
+
+    history holds the channels' earlier trending videos (channel_id, video_id,
+    max_views); the snapshot's own videos are always added to it.
+    """
+    if df.empty:
+        return df
+
+    df = df.copy()
+    keys = _group_keys(df)
+    groups = [df[k] for k in keys] if keys else np.zeros(len(df))
+
+    views = df['view_count'].astype(np.float64)
+    safe_views = views.where(views > 0)
+
+    # Engagement rates
+    df['like_rate'] = (df['like_count'] / safe_views).fillna(0.0)
+    df['comment_rate'] = (df['comment_count'] / safe_views).fillna(0.0)
+    df['engagement_rate'] = df['like_rate'] + df['comment_rate']
+
+    # View counts are heavy-tailed, so they are compared on a log scale
+    log_views = np.log1p(views)
+    df['views_z'] = robust_zscore(log_views, groups)
+    df['engagement_z'] = robust_zscore(df['engagement_rate'], groups)
+
+    # Percentile ranks within each group
+    df['views_percentile'] = views.groupby(groups).rank(pct=True)
+    df['engagement_percentile'] = df['engagement_rate'].groupby(groups).rank(pct=True)
+
+    # Channel baseline: median peak views of the channel's other trending videos
+    snapshot_videos = df.groupby(['channel_id', 'video_id'])['view_count'].max().rename('max_views').reset_index()
+    if history is not None and len(history):
+        snapshot_videos = pd.concat([history[['channel_id', 'video_id', 'max_views']], snapshot_videos])
+        snapshot_videos = snapshot_videos.groupby(['channel_id', 'video_id'])['max_views'].max().reset_index()
+
+    df['channel_median_views'], df['channel_videos'] = channel_baselines(df, snapshot_videos)
+    df['channel_lift'] = (views / df['channel_median_views'].where(df['channel_median_views'] > 0)).fillna(0.0)
+
+    # Outlier flags
+    df['views_outlier'] = df['views_z'] >= OUTLIER_Z
+    df['engagement_outlier'] = df['engagement_z'].abs() >= OUTLIER_Z
+    df['channel_breakout'] = (
+        (df['channel_videos'] >= CHANNEL_MIN_VIDEOS) &
+        (df['channel_lift'] >= CHANNEL_BREAKOUT_RATIO)
+    )
+    df['is_outlier'] = df['views_outlier'] | df['engagement_outlier'] | df['channel_breakout']
+
+    return df
+
+def _reasons(row):
+    """Human readable reasons why a video was flagged"""
+    reasons = []
+    if row['views_outlier']:
+        reasons.append(f"views far above the group median (robust z {row['views_z']:.1f})")
+    if row['engagement_outlier']:
+        direction = 'high' if row['engagement_z'] > 0 else 'low'
+        reasons.append(f"unusually {direction} engagement ({row['engagement_rate']:.2%})")
+    if row['channel_breakout']:
+        reasons.append(f"{row['channel_lift']:.1f}x its channel's usual views (median of {int(row['channel_videos'])} other trending videos)")
+    return reasons
+
+def find_outliers(scored, limit=5):
+    """Top flagged videos per region and category"""
+    outliers = {}
+
+    if scored.empty:
+        return outliers
+
+    flagged = scored[scored['is_outlier']].copy()
+    flagged['outlier_score'] = flagged[['views_z', 'engagement_z']].abs().max(axis=1) + flagged['channel_lift'].clip(upper=10)
+    flagged = flagged.sort_values('outlier_score', ascending=False)
+
+    for (region, category), group in flagged.groupby(['region', 'category'], sort=False):
+        outliers.setdefault(region, {})[category] = [
+            {
+                'video_id': row['video_id'],
+                'title': row['title'],
+                'channel_title': row['channel_title'],
+                'view_count': int(row['view_count']),
+                'engagement_rate': round(float(row['engagement_rate']), 4),
+                'views_percentile': round(float(row['views_percentile']), 3),
+                'reasons': _reasons(row),
+            }
+            for _, row in group.head(limit).iterrows()
+        ]
+
+    return outliers